@@ -19,11 +19,12 @@
 #
 from __future__ import annotations
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import re
 import pandas as pd
 
-from eyetrackingrun import EyeTrackingRun, write_bids
+from eyetrackingrun import EyeTrackingRun, bids_output_names, write_bids
 
 
 TASK_TRIGGER_MSG = {
@@ -33,6 +34,102 @@ TASK_TRIGGER_MSG = {
     "bht": ("hello bht", "Bye bht"),
 }
 
+# Experiment runs each task's recording corresponds to (relative to the session folder)
+TASK_BIDS_GLOB = {
+    "fixation": "dwi/*_dwi.nii.gz",
+    "qct": "func/*_task-qct_*bold.nii.gz",
+    "rest": "func/*_task-rest_*bold.nii.gz",
+    "bht": "func/*_task-bht_*bold.nii.gz",
+}
+
+
+def read_schedule() -> pd.DataFrame:
+    """Read the table mapping sessions to their EDF files."""
+    return pd.read_csv(
+        Path(__file__).parent / "schedule.tsv",
+        sep="\t",
+        na_values="n/a",
+        dtype={"session": "str"},
+    )
+
+
+def convert(recordings: Path, bids_file: Path, edf_file: str, task: str) -> tuple:
+    """Convert one EDF file into the eye-tracking recording of a BIDS run."""
+    trigger_messages = TASK_TRIGGER_MSG[task]
+    et_obj = EyeTrackingRun.from_edf(
+        recordings / edf_file,
+        message_first_trigger=trigger_messages[0],
+        message_last_trigger=trigger_messages[-1],
+    )
+    return write_bids(et_obj, bids_file)
+
+
+def find_runs(bids_root: Path, edf_lookup: pd.DataFrame) -> list[dict]:
+    """Resolve every (session, task) pair of the schedule into its BIDS run."""
+    runs = []
+    for _, row in edf_lookup.iterrows():
+        for task in TASK_TRIGGER_MSG:
+            if pd.isna(row.get(f"{task}_edf")):
+                continue
+
+            # Multi-echo and magnitude/phase images share the same recording
+            bids_files = sorted(
+                bids_root.glob(f"sub-*/ses-{row.session}/{TASK_BIDS_GLOB[task]}")
+            )
+            runs.append(
+                {
+                    "session": row.session,
+                    "task": task,
+                    "edf": row[f"{task}_edf"],
+                    "bids_file": bids_files[0] if bids_files else None,
+                    "output": bids_output_names(bids_files[0])[0]
+                    if bids_files
+                    else None,
+                }
+            )
+    return runs
+
+
+def _convert_run(recordings: Path, run: dict) -> str:
+    convert(recordings, run["bids_file"], run["edf"], run["task"])
+    return "converted"
+
+
+def convert_batch(
+    recordings: Path,
+    bids_root: Path,
+    overwrite: bool = False,
+    n_jobs: int | None = None,
+) -> pd.DataFrame:
+    """Convert all the EDF files of the schedule that are not up to date."""
+    runs = find_runs(bids_root, read_schedule())
+
+    futures = {}
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        for i, run in enumerate(runs):
+            edf_path = recordings / run["edf"]
+            if run["bids_file"] is None:
+                run["status"] = "missing BIDS run"
+            elif not edf_path.exists():
+                run["status"] = "missing EDF"
+            elif (
+                not overwrite
+                and run["output"].exists()
+                and run["output"].stat().st_mtime > edf_path.stat().st_mtime
+            ):
+                run["status"] = "up to date"
+            else:
+                futures[i] = executor.submit(_convert_run, recordings, run)
+
+        for i, future in futures.items():
+            try:
+                runs[i]["status"] = future.result()
+            except Exception as exc:
+                runs[i]["status"] = f"failed ({exc})"
+
+    return pd.DataFrame(runs, columns=["session", "task", "edf", "status", "output"])
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -41,13 +138,37 @@ if __name__ == "__main__":
     parser.add_argument(
         "bids_file",
         type=Path,
-        help="Path to the functional/diffusion image (experiment) this recording corresponds to.",
+        help="Path to the functional/diffusion image (experiment) this recording corresponds to "
+        "(or to the BIDS root with --batch).",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Convert all the sessions and tasks of the schedule found under the BIDS root.",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="With --batch, also convert runs whose outputs are newer than their EDF.",
+    )
+    parser.add_argument(
+        "--n-jobs",
+        type=int,
+        default=None,
+        help="With --batch, number of processes (default: number of CPUs).",
     )
     args = parser.parse_args()
 
     if not args.bids_file.exists():
         raise RuntimeError(f"File <{args.bids_file}> doesn't exist.")
 
+    if args.batch:
+        summary = convert_batch(
+            args.recordings, args.bids_file, overwrite=args.overwrite, n_jobs=args.n_jobs
+        )
+        print(summary.to_string(index=False))
+        raise SystemExit(int(summary.status.str.startswith("failed").any()))
+
     # Extract session number
     if (matches := re.findall(r'/ses-([\w\d]+)/', str(args.bids_file))):
         session = matches[0]
@@ -55,12 +176,7 @@ if __name__ == "__main__":
         raise RuntimeError("Could not extract session name")
 
     # Read schedule
-    edf_lookup = pd.read_csv(
-        Path(__file__).parent / "schedule.tsv",
-        sep="\t",
-        na_values="n/a",
-        dtype={"session": "str"},
-    )
+    edf_lookup = read_schedule()
 
     if not (edf_lookup.session == session).any():
         raise RuntimeError(f"Session {session} not found in schedule")
@@ -75,13 +191,8 @@ if __name__ == "__main__":
 
     print(f"Converting eyetracking corresponding to {args.bids_file}:")
 
-    trigger_messages = TASK_TRIGGER_MSG[task]
     et_session = edf_lookup[edf_lookup.session == session]
-    et_obj = EyeTrackingRun.from_edf(
-        args.recordings / et_session[f"{task}_edf"].values[0],
-        message_first_trigger=trigger_messages[0],
-        message_last_trigger=trigger_messages[-1],
+    out_files = convert(
+        args.recordings, args.bids_file, et_session[f"{task}_edf"].values[0], task
     )
-
-    out_files = write_bids(et_obj, args.bids_file)
     print(f" ---> Written out {', and '.join(out_files)}.")
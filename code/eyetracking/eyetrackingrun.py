@@ -25,7 +25,7 @@ from pathlib import Path
 from warnings import warn
 from collections import defaultdict
 from itertools import product, groupby
-from typing import List, Type
+from typing import List, Tuple, Type
 
 import numpy as np
 import pandas as pd
@@ -82,6 +82,58 @@ BIDS_COLUMNS_ORDER = (
 )
 
 
+def annotate_intervals(
+    timestamps: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+) -> np.ndarray:
+    """
+    Flag the samples falling within any of the closed intervals [start, end].
+
+    Parameters
+    ----------
+    timestamps : :obj:`numpy.ndarray`
+        Timestamps of the samples.
+    starts : :obj:`numpy.ndarray`
+        Start timestamps of the intervals.
+    ends : :obj:`numpy.ndarray`
+        End timestamps of the intervals.
+
+    Returns
+    -------
+    :obj:`numpy.ndarray`
+        An integer array with 1 for samples within an interval and 0 otherwise.
+
+    Notes
+    -----
+    The interval bounds are located with :obj:`numpy.searchsorted` and accumulated in
+    a difference array, so that the cost is O(samples + events) instead of one full
+    mask per event.
+
+    """
+    order = None
+    if np.any(np.diff(timestamps) < 0):
+        order = np.argsort(timestamps, kind="stable")
+        timestamps = timestamps[order]
+
+    first = np.searchsorted(timestamps, starts, side="left")
+    last = np.searchsorted(timestamps, ends, side="right")
+    # Events with missing bounds never match any sample
+    valid = (first < last) & np.isfinite(starts) & np.isfinite(ends)
+
+    delta = np.zeros(len(timestamps) + 1, dtype=int)
+    np.add.at(delta, first[valid], 1)
+    np.add.at(delta, last[valid], -1)
+    inside = (np.cumsum(delta[:-1]) > 0).astype(int)
+
+    if order is not None:
+        unsorted = np.empty_like(inside)
+        unsorted[order] = inside
+        inside = unsorted
+
+    return inside
+
+
 class EyeTrackingRun:
     """
     Class representing an instance of eye tracking data.
@@ -450,37 +502,21 @@ class EyeTrackingRun:
                 except AttributeError:
                     warn("Calibration data found but unsuccessfully parsed for results")
 
-        # Process events: first generate empty columns
-        self.recording["fixation"] = 0
-        self.recording["saccade"] = 0
-        self.recording["blink"] = 0
-
-        # Add fixations
-        for _, fixation_event in self.events[
-            self.events["type"] == "fixation"
-        ].iterrows():
-            self.recording.loc[
-                (self.recording["timestamp"] >= fixation_event["start"])
-                & (self.recording["timestamp"] <= fixation_event["end"]),
-                "fixation",
-            ] = 1
-
-        # Add saccades, and blinks, which are a sub-event of saccades
-        for _, saccade_event in self.events[
-            self.events["type"] == "saccade"
-        ].iterrows():
-            self.recording.loc[
-                (self.recording["timestamp"] >= saccade_event["start"])
-                & (self.recording["timestamp"] <= saccade_event["end"]),
-                "saccade",
-            ] = 1
-
-            if saccade_event["blink"] == 1:
-                self.recording.loc[
-                    (self.recording["timestamp"] >= saccade_event["start"])
-                    & (self.recording["timestamp"] <= saccade_event["end"]),
-                    "blink",
-                ] = 1
+        # Process events: annotate samples within [start, end] of each event
+        timestamps = self.recording["timestamp"].values
+        fixations = self.events[self.events["type"] == "fixation"]
+        saccades = self.events[self.events["type"] == "saccade"]
+        # Blinks are a sub-event of saccades
+        blinks = saccades[saccades["blink"] == 1]
+
+        for column, events in (
+            ("fixation", fixations),
+            ("saccade", saccades),
+            ("blink", blinks),
+        ):
+            self.recording[column] = annotate_intervals(
+                timestamps, events["start"].values, events["end"].values
+            )
 
         # Reorder columns to render nicely (tracking first, pupil size after)
         # Remove the multiple eyes ordering and eye1_ prefix
@@ -563,28 +599,21 @@ class EyeTrackingRun:
         )
 
 
-def write_bids(
-    et_run: EyeTrackingRun,
-    exp_run: str | Path,
-) -> List[str]:
+def bids_output_names(exp_run: str | Path) -> Tuple[Path, Path]:
     """
-    Save an eye-tracking run into a existing BIDS structure.
+    Generate the names of the eye-tracking files corresponding to a BIDS run.
 
     Parameters
     ----------
-    et_run : :obj:`EyeTrackingRun`
-        An object representing an eye-tracking run.
     exp_run : :obj:`os.pathlike`
         The path of the corresponding neuroimaging experiment in BIDS.
 
     Returns
     -------
-    List[str]
-        A list of generated files.
+    Tuple[Path, Path]
+        The paths of the recording (``.tsv.gz``) and of its sidecar JSON.
 
     """
-    from ppjson import CompactJSONEncoder
-
     exp_run = Path(exp_run)
     out_dir = exp_run.parent
     refname = exp_run.name
@@ -598,21 +627,43 @@ def write_bids(
     # Replace suffix
     refname = refname.replace(f"_{suffix}", "_recording-eyetrack_physio")
 
+    return (
+        out_dir / refname.replace(extension, ".tsv.gz"),
+        out_dir / refname.replace(extension, ".json"),
+    )
+
+
+def write_bids(
+    et_run: EyeTrackingRun,
+    exp_run: str | Path,
+) -> List[str]:
+    """
+    Save an eye-tracking run into a existing BIDS structure.
+
+    Parameters
+    ----------
+    et_run : :obj:`EyeTrackingRun`
+        An object representing an eye-tracking run.
+    exp_run : :obj:`os.pathlike`
+        The path of the corresponding neuroimaging experiment in BIDS.
+
+    Returns
+    -------
+    List[str]
+        A list of generated files.
+
+    """
+    from ppjson import CompactJSONEncoder
+    from physiotsv import write_physio_tsvgz
+
+    out_tsvgz, out_json = bids_output_names(exp_run)
+
     # Write out sidecar JSON
-    out_json = out_dir / refname.replace(extension, ".json")
     out_json.write_text(
         json.dumps(et_run.metadata, sort_keys=True, indent=2, cls=CompactJSONEncoder)
     )
 
     # Write out data
-    out_tsvgz = out_dir / refname.replace(extension, ".tsv.gz")
-    et_run.recording.to_csv(
-        out_tsvgz,
-        sep="\t",
-        index=False,
-        header=False,
-        compression="gzip",
-        na_rep="n/a",
-    )
+    write_physio_tsvgz(et_run.recording, out_tsvgz, na_rep="n/a")
 
     return str(out_tsvgz), str(out_json)
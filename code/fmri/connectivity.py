@@ -0,0 +1,308 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2023 The Axon Lab <theaxonlab@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Batched estimation of functional connectivity, one fit per session"""
+
+import inspect
+import logging
+import time
+import warnings
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.covariance import (
+    GraphicalLasso,
+    GraphicalLassoCV,
+    LedoitWolf,
+    empirical_covariance,
+)
+from sklearn.exceptions import ConvergenceWarning
+
+# The public graphical_lasso no longer accepts an initial covariance (sklearn 1.5).
+# The private solver may change in any release, warm starts then fall back to cold
+# starts.
+try:
+    from sklearn.covariance._graph_lasso import _graphical_lasso
+except ImportError:
+    _graphical_lasso = None
+if (
+    _graphical_lasso is not None
+    and "cov_init" not in inspect.signature(_graphical_lasso).parameters
+):
+    _graphical_lasso = None
+
+from nilearn.connectome import ConnectivityMeasure, vec_to_sym_matrix
+
+FIT_REPORT_COLUMNS: tuple = ("alpha", "n_iter", "converged", "duration")
+
+
+class WarmStartGraphicalLasso(GraphicalLasso):
+    """Sparse inverse covariance estimation with a fixed alpha, starting the
+    optimization from a given covariance estimate (usually the group average).
+
+    Parameters
+    ----------
+    alpha : float, optional
+        Regularization parameter, by default 0.01
+    cov_init : Optional[np.ndarray], optional
+        Initial guess of the covariance, by default None (empirical covariance)
+    mode : str, optional
+        Solver of the lasso problems, "cd" or "lars", by default "cd"
+    tol : float, optional
+        Tolerance to declare convergence, by default 1e-4
+    enet_tol : float, optional
+        Tolerance of the elastic net solver, by default 1e-4
+    max_iter : int, optional
+        Maximum number of iterations, by default 100
+    verbose : bool, optional
+        Verbosity of the solver, by default False
+    assume_centered : bool, optional
+        Whether the data are already centered, by default False
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.01,
+        *,
+        cov_init: Optional[np.ndarray] = None,
+        mode: str = "cd",
+        tol: float = 1e-4,
+        enet_tol: float = 1e-4,
+        max_iter: int = 100,
+        verbose: bool = False,
+        assume_centered: bool = False,
+    ):
+        super().__init__(
+            alpha=alpha,
+            mode=mode,
+            tol=tol,
+            enet_tol=enet_tol,
+            max_iter=max_iter,
+            verbose=verbose,
+            assume_centered=assume_centered,
+        )
+        self.cov_init = cov_init
+
+    def fit(self, X: np.ndarray, y=None) -> "WarmStartGraphicalLasso":
+        """Fit the sparse inverse covariance of X, starting from `cov_init`.
+
+        If the solver of scikit-learn does not accept an initial covariance, the
+        optimization starts from the empirical covariance (cold start).
+        """
+        if _graphical_lasso is None:
+            if self.cov_init is not None:
+                logging.warning(
+                    "Warm starts are not supported by this version of scikit-learn, "
+                    "fitting from the empirical covariance."
+                )
+            return super().fit(X)
+
+        X = np.asarray(X, dtype=np.float64)
+        if self.assume_centered:
+            self.location_ = np.zeros(X.shape[1])
+        else:
+            self.location_ = X.mean(axis=0)
+
+        emp_cov = empirical_covariance(X, assume_centered=self.assume_centered)
+        # Returns the covariance, the precision, (the costs,) and the iterations
+        solution = _graphical_lasso(
+            emp_cov,
+            alpha=self.alpha,
+            cov_init=self.cov_init,
+            mode=self.mode,
+            tol=self.tol,
+            enet_tol=self.enet_tol,
+            max_iter=self.max_iter,
+            verbose=self.verbose,
+        )
+        self.covariance_, self.precision_, self.n_iter_ = (
+            solution[0],
+            solution[1],
+            solution[-1],
+        )
+        return self
+
+
+def fit_single_connectivity(
+    time_series: np.ndarray,
+    estimator: Union[LedoitWolf, GraphicalLasso, GraphicalLassoCV],
+    connectivity_kind: str = "correlation",
+) -> tuple[np.ndarray, dict]:
+    """Compute the functional connectivity of one session and report on the fit.
+
+    Parameters
+    ----------
+    time_series : np.ndarray
+        Timeseries of the session, of shape (n_volumes, n_regions)
+    estimator : Union[LedoitWolf, GraphicalLasso, GraphicalLassoCV]
+        Covariance estimator, cloned before fitting
+    connectivity_kind : str, optional
+        Type of connectivity to compute, by default "correlation"
+
+    Returns
+    -------
+    tuple[np.ndarray, dict]
+        The vectorized connectivity (without diagonal) and the fit report, i.e. the
+        regularization, number of iterations, convergence and duration (in seconds).
+    """
+    start = time.perf_counter()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ConvergenceWarning)
+        connectivity_measure = ConnectivityMeasure(
+            cov_estimator=clone(estimator),
+            kind=connectivity_kind,
+            vectorize=True,
+            discard_diagonal=True,
+        )
+        connectivity = connectivity_measure.fit_transform([time_series])[0]
+
+    fitted = connectivity_measure.cov_estimator_
+    report = {
+        "alpha": getattr(fitted, "alpha_", getattr(fitted, "alpha", np.nan)),
+        "n_iter": getattr(fitted, "n_iter_", np.nan),
+        "converged": not any(
+            issubclass(warning.category, ConvergenceWarning) for warning in caught
+        ),
+        "duration": time.perf_counter() - start,
+    }
+    return connectivity, report
+
+
+def standardize_columns(time_series: np.ndarray) -> np.ndarray:
+    """Z-score each column of the timeseries (constant columns are only centered)."""
+    std = time_series.std(axis=0)
+    std[std == 0] = 1
+    return (time_series - time_series.mean(axis=0)) / std
+
+
+def fit_group_estimate(
+    time_series: list[np.ndarray], estimator: GraphicalLassoCV
+) -> tuple[float, np.ndarray]:
+    """Select the regularization by cross-validation on the pooled (standardized)
+    timeseries of all sessions.
+
+    Parameters
+    ----------
+    time_series : list[np.ndarray]
+        List of timeseries, each of shape (n_volumes, n_regions)
+    estimator : GraphicalLassoCV
+        Cross-validated sparse inverse covariance estimator, cloned before fitting
+
+    Returns
+    -------
+    tuple[float, np.ndarray]
+        The selected alpha and the group-average covariance estimated with it.
+    """
+    logging.info("Selecting the regularization on the pooled timeseries ...")
+    group_estimator = clone(estimator).fit(
+        np.vstack([standardize_columns(ts) for ts in time_series])
+    )
+    logging.info(f"Shared regularization: alpha={group_estimator.alpha_:.4g}")
+    return float(group_estimator.alpha_), group_estimator.covariance_
+
+
+def compute_connectivity_batch(
+    time_series: list[np.ndarray],
+    estimator: Union[LedoitWolf, GraphicalLassoCV],
+    connectivity_kind: str = "correlation",
+    n_jobs: int = 1,
+    shared_alpha: bool = False,
+    warm_start: bool = False,
+    group_estimate: Optional[tuple[float, np.ndarray]] = None,
+) -> tuple[np.ndarray, pd.DataFrame]:
+    """Compute the functional connectivity of each session, fitting the sessions in
+    parallel.
+
+    With a GraphicalLassoCV estimator, the regularization can be selected once by
+    cross-validation on the pooled (standardized) timeseries of all sessions, and
+    each session is then fitted with this alpha. The fits can also be warm-started
+    from the group-average estimate obtained on the pooled timeseries.
+
+    Parameters
+    ----------
+    time_series : list[np.ndarray]
+        List of timeseries, each of shape (n_volumes, n_regions)
+    estimator : Union[LedoitWolf, GraphicalLassoCV]
+        Covariance estimator (usually from Scikit-Learn)
+    connectivity_kind : str, optional
+        Type of connectivity to compute, by default "correlation"
+    n_jobs : int, optional
+        Number of sessions fitted in parallel, by default 1
+    shared_alpha : bool, optional
+        Select the regularization once on the pooled timeseries, by default False
+    warm_start : bool, optional
+        Start each fit from the group-average estimate, by default False. It
+        requires `shared_alpha`.
+    group_estimate : Optional[tuple[float, np.ndarray]], optional
+        Shared alpha and group-average covariance (see `fit_group_estimate`) to
+        reuse, by default None (estimated on the given timeseries)
+
+    Returns
+    -------
+    tuple[np.ndarray, pd.DataFrame]
+        The connectivity matrices, of shape (n_sessions, n_regions, n_regions), and
+        the fit report of each session.
+
+    Raises
+    ------
+    ValueError
+        If `warm_start` is requested without `shared_alpha`.
+    """
+    if warm_start and not shared_alpha:
+        raise ValueError("Warm starts require a fixed alpha, use a shared alpha.")
+
+    if not len(time_series):
+        return np.empty((0, 0, 0)), pd.DataFrame(columns=FIT_REPORT_COLUMNS)
+
+    if shared_alpha and not isinstance(estimator, GraphicalLassoCV):
+        logging.warning(
+            "Shared alpha and warm starts only apply to GraphicalLassoCV, ignoring."
+        )
+    elif shared_alpha:
+        if group_estimate is None:
+            group_estimate = fit_group_estimate(time_series, estimator)
+        alpha, group_covariance = group_estimate
+        estimator = WarmStartGraphicalLasso(
+            alpha=alpha,
+            cov_init=group_covariance if warm_start else None,
+            mode=estimator.mode,
+            tol=estimator.tol,
+            enet_tol=estimator.enet_tol,
+            max_iter=estimator.max_iter,
+            assume_centered=estimator.assume_centered,
+        )
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(fit_single_connectivity)(ts, estimator, connectivity_kind)
+        for ts in time_series
+    )
+    connectivities, reports = zip(*results)
+
+    n_ts = len(time_series)
+    n_area = time_series[0].shape[-1]
+    fc_matrices = vec_to_sym_matrix(
+        np.stack(connectivities), diagonal=np.zeros((n_ts, n_area))
+    )
+    return fc_matrices, pd.DataFrame(list(reports), columns=FIT_REPORT_COLUMNS)
@@ -0,0 +1,215 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2023 The Axon Lab <theaxonlab@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Batched interpolation and denoising of regional timeseries, stacking the runs
+of the same length"""
+
+from typing import Optional
+
+import numpy as np
+from joblib import Parallel, delayed
+
+from nilearn._utils import stringify_path
+from nilearn.signal import (
+    _detrend,
+    _handle_scrubbed_volumes,
+    _sanitize_confounds,
+    butterworth,
+)
+
+EPS = np.finfo(np.float64).eps
+
+
+def interpolate_run(
+    time_series: np.ndarray,
+    confounds,
+    sample_mask: Optional[np.ndarray],
+    t_r: float,
+) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """Interpolate the censored volumes of a run and of its confounds.
+
+    The signals and confounds are interpolated together, with a single cubic spline
+    fit.
+
+    Parameters
+    ----------
+    time_series : np.ndarray
+        Regional timeseries of the run (n_volumes, n_regions)
+    confounds : Union[np.ndarray, pd.DataFrame, str, None]
+        Confounds of the run
+    sample_mask : Optional[np.ndarray]
+        Volumes to keep, the others are interpolated
+    t_r : float
+        Repetition time of the MRI acquisition
+
+    Returns
+    -------
+    tuple[np.ndarray, Optional[np.ndarray]]
+        Interpolated timeseries and confounds (None if no confounds were given).
+    """
+    n_regions = time_series.shape[1]
+    # This is required as we are manually doing some internal Nilearn machinery
+    confounds = _sanitize_confounds(
+        time_series.shape[0], n_runs=1, confounds=stringify_path(confounds)
+    )
+    if confounds is None:
+        stacked = time_series.copy()
+    else:
+        stacked = np.hstack((time_series, confounds))
+
+    stacked, _ = _handle_scrubbed_volumes(
+        signals=stacked,
+        confounds=None,
+        sample_mask=sample_mask,
+        filter_type="butterworth",
+        t_r=t_r,
+    )
+    if confounds is None:
+        return stacked, None
+    return stacked[:, :n_regions], stacked[:, n_regions:]
+
+
+def clean_batch(
+    signals: np.ndarray,
+    confounds: Optional[np.ndarray] = None,
+    t_r: Optional[float] = None,
+    low_pass: Optional[float] = None,
+) -> np.ndarray:
+    """Denoise a stack of runs of the same length, as `nilearn.signal.clean` would
+    with `standardize="zscore_sample"` and Butterworth filtering.
+
+    The detrending and filtering are applied once to all the runs (and confounds),
+    and the confounds are regressed out with a batched projection.
+
+    Parameters
+    ----------
+    signals : np.ndarray
+        Stacked timeseries (n_runs, n_volumes, n_regions)
+    confounds : Optional[np.ndarray], optional
+        Stacked confounds (n_runs, n_volumes, n_confounds), by default None
+    t_r : Optional[float], optional
+        Repetition time of the MRI acquisition, by default None
+    low_pass : Optional[float], optional
+        Low-pass filtering cutoff frequency, by default None
+
+    Returns
+    -------
+    np.ndarray
+        Denoised timeseries (n_runs, n_volumes, n_regions).
+    """
+    n_runs, n_volumes, n_regions = signals.shape
+    if confounds is not None:
+        signals = np.concatenate((signals, confounds), axis=2)
+
+    # Volumes along the first axis, as expected by Nilearn (one column per signal)
+    columns = np.moveaxis(signals, 1, 0).reshape(n_volumes, -1)
+    columns = _detrend(columns, inplace=False)
+    if low_pass is not None:
+        columns = butterworth(columns, sampling_rate=1.0 / t_r, low_pass=low_pass)
+    signals = np.moveaxis(columns.reshape(n_volumes, n_runs, -1), 0, 1)
+
+    # Remove confounds
+    if confounds is not None:
+        signals, confounds = signals[..., :n_regions], signals[..., n_regions:]
+        confounds = confounds - confounds.mean(axis=1, keepdims=True)
+        std = confounds.std(axis=1, keepdims=True)
+        std[std < EPS] = 1.0
+        confounds = confounds / std
+        # Rank-deficient confounds are handled by the pseudo-inverse
+        projection = np.linalg.pinv(confounds, rcond=EPS * 100.0)
+        signals = signals - confounds @ (projection @ signals)
+
+    # Standardize
+    signals = signals - signals.mean(axis=1, keepdims=True)
+    std = signals.std(axis=1, ddof=1, keepdims=True)
+    std[std < EPS] = 1.0
+    return signals / std
+
+
+def interpolate_and_denoise_batch(
+    time_series: list[np.ndarray],
+    confounds: list,
+    sample_mask: list,
+    t_r: Optional[float] = None,
+    low_pass: Optional[float] = None,
+    n_jobs: int = 1,
+) -> tuple[list[np.ndarray], list[np.ndarray], list]:
+    """Interpolate the censored volumes of several runs and denoise them.
+
+    Runs with the same number of volumes and of confounds are stacked and denoised
+    together (see `clean_batch`). Each stack is processed by a worker.
+
+    Parameters
+    ----------
+    time_series : list[np.ndarray]
+        Regional timeseries of the runs
+    confounds : list
+        Confounds of the runs (usually from nilearn.interface.fmriprep.load_confounds)
+    sample_mask : list
+        Sample masks of the runs (usually from
+        nilearn.interface.fmriprep.load_confounds)
+    t_r : Optional[float], optional
+        Repetition time of the MRI acquisition, by default None
+    low_pass : Optional[float], optional
+        Low-pass filtering cutoff frequency, by default None
+    n_jobs : int, optional
+        Number of workers, by default 1
+
+    Returns
+    -------
+    tuple[list[np.ndarray], list[np.ndarray], list]
+        Three lists, in the order of the runs: the denoised timeseries, the
+        interpolated timeseries and the interpolated confounds.
+    """
+    interpolated = [
+        interpolate_run(ts, conf, sm, t_r)
+        for ts, conf, sm in zip(time_series, confounds, sample_mask)
+    ]
+
+    # Group the runs that can be stacked
+    batches = {}
+    for i, (signals, conf) in enumerate(interpolated):
+        key = (signals.shape, None if conf is None else conf.shape[1])
+        batches.setdefault(key, []).append(i)
+
+    def _clean_batch(indices):
+        signals = np.stack([interpolated[i][0] for i in indices])
+        conf = None
+        if interpolated[indices[0]][1] is not None:
+            conf = np.stack([interpolated[i][1] for i in indices])
+        return clean_batch(signals, conf, t_r=t_r, low_pass=low_pass)
+
+    batch_indices = list(batches.values())
+    denoised_batches = Parallel(
+        n_jobs=max(min(n_jobs, len(batch_indices)), 1), backend="threading"
+    )(delayed(_clean_batch)(indices) for indices in batch_indices)
+
+    denoised = [None] * len(interpolated)
+    for indices, batch in zip(batch_indices, denoised_batches):
+        for i, denoised_signals in zip(indices, batch):
+            denoised[i] = denoised_signals
+
+    return (
+        denoised,
+        [signals for signals, _ in interpolated],
+        [conf for _, conf in interpolated],
+    )
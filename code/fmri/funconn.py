@@ -38,35 +38,56 @@ import logging
 import os
 import os.path as op
 from itertools import chain
+from threading import Lock
 from typing import Optional, Union
 
 import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from connectivity import compute_connectivity_batch, fit_group_estimate
+from denoising import interpolate_and_denoise_batch
+from nilearn_patcher import MapsProjector
 from nilearn_patcher import MultiNiftiMapsMasker as MultiNiftiMapsMasker_patched
 from sklearn.covariance import GraphicalLassoCV, LedoitWolf
 
-from nilearn._utils import stringify_path
-from nilearn.connectome import ConnectivityMeasure, vec_to_sym_matrix
-from nilearn.interfaces.fmriprep import load_confounds
 from nilearn.maskers import MultiNiftiMapsMasker
-from nilearn.signal import _handle_scrubbed_volumes, _sanitize_confounds, clean
+from nilearn.signal import clean
 
-from reports import plot_interpolation, visual_report_timeserie, visual_report_fc
+from reports import REPORT_MODES, plot_interpolation, queue_reports, render_reports
 from load_save import (
+    append_group_store,
     find_derivative,
     check_existing_output,
+    get_bids_savename,
     get_atlas_data,
-    get_confounds_manually,
     get_func_filenames_bids,
+    get_raw_signals_path,
+    get_resampled_atlas,
+    load_confounds_parallel,
+    load_connectivity_state,
+    load_group_estimate,
+    save_connectivity_state,
     save_output,
     load_timeseries,
+    update_connectivity_state,
     FC_FILLS,
     FC_PATTERN,
+    ATLAS_CACHE_DIRNAME,
+    OUTPUT_FORMATS,
     TIMESERIES_FILLS,
     TIMESERIES_PATTERN,
 )
 
 NETWORK_MAPPING: str = "yeo_networks7"  # Also yeo_networks17
 
+# Caches the resampled atlas maps as well as the extracted signals
+MASKER_MEMORY_LEVEL: int = 2
+# Number of volumes read at once when streaming the functional images
+DEFAULT_BLOCK_SIZE: int = 100
+
+# Pyplot is not thread-safe and FoV/TR groups may be processed concurrently
+PLOT_LOCK = Lock()
+
 
 def get_arguments() -> argparse.Namespace:
     parser: argparse.ArgumentParser = argparse.ArgumentParser(
@@ -89,6 +110,15 @@ def get_arguments() -> argparse.Namespace:
         "(will be followed by the name and dimension of the atlas)",
     )
 
+    parser.add_argument(
+        "--output-format",
+        default="tsv",
+        action="store",
+        choices=OUTPUT_FORMATS,
+        help="save timeseries and connectivity matrices as TSV, as binary .npy "
+        "sidecars (memory-mappable, faster to load) or both",
+    )
+
     # Script specific options
     parser.add_argument(
         "--overwrite",
@@ -189,6 +219,28 @@ def get_arguments() -> argparse.Namespace:
         help="""type of connectivity to compute (can be 'correlation', 'covariance' or
         'sparse')""",
     )
+    parser.add_argument(
+        "--shared-alpha",
+        default=False,
+        action="store_true",
+        help="select the sparsity of the inverse covariance once on the pooled "
+        "timeseries of all sessions, instead of once per session",
+    )
+    parser.add_argument(
+        "--warm-start",
+        default=False,
+        action="store_true",
+        help="start the sparse inverse covariance fit of each session from the "
+        "group-average estimate (requires --shared-alpha)",
+    )
+    parser.add_argument(
+        "--incremental",
+        default=False,
+        action="store_true",
+        help="reuse the group-level terms (shared alpha and group-average estimate) "
+        "recorded by previous runs, so that only the new sessions are estimated "
+        "(requires --shared-alpha)",
+    )
     parser.add_argument(
         "--no-censor",
         default=False,
@@ -196,6 +248,53 @@ def get_arguments() -> argparse.Namespace:
         help="interpolate volumes with high motion without censoring",
     )
 
+    parser.add_argument(
+        "--fast-plots",
+        default=False,
+        action="store_true",
+        help="draw the signal plots of the visual reports as a single rasterized "
+        "artist (recommended for large atlases)",
+    )
+    parser.add_argument(
+        "--reports",
+        default="inline",
+        action="store",
+        choices=REPORT_MODES,
+        help="render the visual reports during the computation, queue them to be "
+        "rendered in bulk later with funconn_reports.py --queue, or skip them",
+    )
+    parser.add_argument(
+        "--n-jobs",
+        default=8,
+        action="store",
+        type=int,
+        help="total number of workers, shared between and within the groups of files "
+        "with similar FoV and TR",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        action="store",
+        help="cache directory of the raw regional signals, of the parsed confounds "
+        "and of the maskers, so that re-running with other denoising parameters "
+        "skips reading the images",
+    )
+    parser.add_argument(
+        "--block-size",
+        default=None,
+        action="store",
+        type=int,
+        help="stream the functional images by blocks of this many volumes when "
+        "extracting the regional signals, which bounds the memory used by each worker "
+        "(by default, whole images are handed to the masker)",
+    )
+    parser.add_argument(
+        "--layout-db",
+        default=None,
+        action="store",
+        help="folder where the BIDS layout database is persisted and reused "
+        "(by default, under ~/.cache/hcph-funconn)",
+    )
     parser.add_argument(
         "-v",
         "--verbosity",
@@ -207,6 +306,11 @@ def get_arguments() -> argparse.Namespace:
 
     args = parser.parse_args()
 
+    if args.warm_start and not args.shared_alpha:
+        parser.error("--warm-start requires --shared-alpha")
+    if args.incremental and not args.shared_alpha:
+        parser.error("--incremental requires --shared-alpha")
+
     return args
 
 
@@ -215,6 +319,7 @@ def fit_transform_patched(
     atlas_filename: str,
     confounds: Optional[list] = None,
     sample_mask: Optional[list] = None,
+    memory: Optional[str] = None,
     **kwargs,
 ) -> list[np.ndarray]:
     """Attempt to use NiLearn's MultiNiftiMapsMaskers, if it fails it will use the
@@ -232,12 +337,17 @@ def fit_transform_patched(
     sample_mask : Optional[list], optional
         List of sample masks (usually from nilearn.interface.fmriprep.load_confounds),
         by default None
+    memory : Optional[str], optional
+        Path to the joblib cache directory of the masker, by default None (no caching)
 
     Returns
     -------
     list[np.ndarray]
         List of extracted and denoised timeseries
     """
+    if memory is not None:
+        kwargs.update(memory=memory, memory_level=MASKER_MEMORY_LEVEL)
+
     masker = MultiNiftiMapsMasker(maps_img=atlas_filename, **kwargs)
 
     try:
@@ -258,6 +368,128 @@ def fit_transform_patched(
     return time_series
 
 
+def project_raw_signals(
+    func_filename: list[str],
+    atlas_filename: str,
+    cache_dir: Optional[str] = None,
+    verbose: int = 2,
+    n_jobs: int = 1,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> list[np.ndarray]:
+    """Extract the raw (not denoised) regional signals with a precomputed projector
+    of the maps, streaming the functional images by blocks of volumes.
+
+    Parameters
+    ----------
+    func_filename : list[str]
+        List of BIDS functional filenames
+    atlas_filename : str
+        Path to the atlas file
+    cache_dir : Optional[str], optional
+        Path to the cache directory of the projector, by default None
+    verbose : int, optional
+        Amount of verbosity, by default 2
+    n_jobs : int, optional
+        Number of workers, by default 1
+    block_size : int, optional
+        Number of volumes read at once, by default DEFAULT_BLOCK_SIZE
+
+    Returns
+    -------
+    list[np.ndarray]
+        List of raw regional signals
+    """
+    try:
+        # The projector of the maps is computed once and shared by all the runs
+        return MapsProjector(
+            atlas_filename, chunk_size=block_size, cache_dir=cache_dir, n_jobs=n_jobs
+        ).fit_transform(func_filename)
+    except ValueError as msg:
+        logging.warning(f"Falling back to the masker for extraction: {msg}")
+        return fit_transform_patched(
+            func_filename,
+            atlas_filename,
+            verbose=verbose,
+            n_jobs=n_jobs,
+            memory=cache_dir,
+        )
+
+
+def extract_raw_signals(
+    func_filename: list[str],
+    atlas_filename: str,
+    cache_dir: Optional[str] = None,
+    verbose: int = 2,
+    n_jobs: int = 1,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> list[np.ndarray]:
+    """Extract the raw (not denoised) regional signals, reusing the signals cached
+    for previous runs with the same functional file and atlas.
+
+    The projection onto the maps is linear, so denoising the raw regional signals
+    with `nilearn.signal.clean` is equivalent to letting the masker denoise them.
+    The signals are extracted with a precomputed projector of the maps, unless the
+    atlas is not on the grid of the functional files.
+
+    Parameters
+    ----------
+    func_filename : list[str]
+        List of BIDS functional filenames
+    atlas_filename : str
+        Path to the atlas file
+    cache_dir : Optional[str], optional
+        Path to the cache directory, by default None (no caching)
+    verbose : int, optional
+        Amount of verbosity, by default 2
+    n_jobs : int, optional
+        Number of workers of the masker, by default 1
+    block_size : int, optional
+        Number of volumes read at once, by default DEFAULT_BLOCK_SIZE
+
+    Returns
+    -------
+    list[np.ndarray]
+        List of raw regional signals
+    """
+    if cache_dir is None:
+        return project_raw_signals(
+            func_filename,
+            atlas_filename,
+            verbose=verbose,
+            n_jobs=n_jobs,
+            block_size=block_size,
+        )
+
+    cache_paths = [
+        get_raw_signals_path(cache_dir, filename, atlas_filename)
+        for filename in func_filename
+    ]
+    to_extract = [
+        (filename, path)
+        for filename, path in zip(func_filename, cache_paths)
+        if not op.exists(path)
+    ]
+    logging.info(
+        f"Raw signals found in cache for {len(func_filename) - len(to_extract)} "
+        f"out of {len(func_filename)} files."
+    )
+
+    if to_extract:
+        raw_signals = project_raw_signals(
+            [filename for filename, _ in to_extract],
+            atlas_filename,
+            cache_dir,
+            verbose=verbose,
+            n_jobs=n_jobs,
+            block_size=block_size,
+        )
+        for signals, (_, path) in zip(raw_signals, to_extract):
+            os.makedirs(op.dirname(path), exist_ok=True)
+            np.save(path, signals)
+
+    return [np.load(path) for path in cache_paths]
+
+
 def interpolate_and_denoise_timeseries(
     func_filename: list[str],
     atlas_filename: str,
@@ -267,6 +499,11 @@ def interpolate_and_denoise_timeseries(
     low_pass: Optional[float] = None,
     output: Optional[str] = None,
     verbose: int = 2,
+    n_jobs: int = 1,
+    memory: Optional[str] = None,
+    block_size: Optional[int] = None,
+    fast_plots: bool = False,
+    reports: str = "inline",
 ) -> tuple[list[np.ndarray], list]:
     """Interpolate and denoise the timeseries without censoring high motion volumes.
 
@@ -288,6 +525,19 @@ def interpolate_and_denoise_timeseries(
         Path to the output directory, by default None
     verbose : int, optional
         Amount of verbosity, by default 2
+    n_jobs : int, optional
+        Number of workers of the masker and of the denoising, by default 1
+    memory : Optional[str], optional
+        Path to the cache directory, by default None. If provided, the raw regional
+        signals are cached.
+    block_size : Optional[int], optional
+        Number of volumes read at once, by default None. If provided, the images are
+        streamed by blocks instead of being loaded whole by the masker.
+    fast_plots : bool, optional
+        Draw the interpolation plots as rasterized LineCollections, by default False
+    reports : str, optional
+        Render the interpolation plots ("inline"), queue them ("deferred") or skip
+        them ("none"), by default "inline"
 
     Returns
     -------
@@ -297,54 +547,65 @@ def interpolate_and_denoise_timeseries(
     """
     logging.info("Interpolating signal (no censoring) ...")
     # Extract the regional signals
-    extracted_time_series = fit_transform_patched(
-        func_filename,
-        atlas_filename,
-        standardize="zscore_sample",
-        verbose=verbose,
-        n_jobs=8,
-    )
-
-    interpolated_signals = []
-    interpolated_confounds = []
-    denoised_signals = []
-    for ts, conf, sm, fn in zip(
-        extracted_time_series, confounds, sample_mask, func_filename
-    ):
-        logging.debug(
-            f"Timeserie has length {ts.shape[0]} and sample mask has "
-            f"length {len(sm)}"
+    if memory is not None or block_size is not None:
+        extracted_time_series = [
+            clean(raw_signals, detrend=False, standardize="zscore_sample")
+            for raw_signals in extract_raw_signals(
+                func_filename,
+                atlas_filename,
+                memory,
+                verbose=verbose,
+                n_jobs=n_jobs,
+                block_size=block_size or DEFAULT_BLOCK_SIZE,
+            )
+        ]
+    else:
+        extracted_time_series = fit_transform_patched(
+            func_filename,
+            atlas_filename,
+            standardize="zscore_sample",
+            verbose=verbose,
+            n_jobs=n_jobs,
         )
 
-        # This is required as we are manually doing some internal Nilearn machinery
-        conf = _sanitize_confounds(ts.shape[0], n_runs=1, confounds=conf)
-        conf = stringify_path(conf)
-
-        ts_to_interpolate = ts.copy()
-
-        inter_sig, inter_conf = _handle_scrubbed_volumes(
-            signals=ts_to_interpolate,
-            confounds=conf,
-            sample_mask=sm,
-            filter_type="butterworth",
+    # Runs of the same length are interpolated and denoised as a stack
+    denoised_signals, interpolated_signals, interpolated_confounds = (
+        interpolate_and_denoise_batch(
+            extracted_time_series,
+            confounds,
+            sample_mask,
             t_r=t_r,
-        )
-
-        if output is not None:
-            plot_interpolation(ts, inter_sig, fn, output)
-
-        # Denoise the signals
-        denoised_sig = clean(
-            inter_sig,
-            standardize="zscore_sample",
-            confounds=inter_conf,
             low_pass=low_pass,
-            t_r=t_r,
+            n_jobs=n_jobs,
         )
+    )
+    # The design matrices of the reports are labelled with the confound names
+    interpolated_confounds = [
+        pd.DataFrame(inter_conf, columns=conf.columns)
+        if isinstance(conf, pd.DataFrame) and inter_conf is not None
+        else inter_conf
+        for inter_conf, conf in zip(interpolated_confounds, confounds)
+    ]
 
-        interpolated_signals.append(inter_sig)
-        interpolated_confounds.append(inter_conf)
-        denoised_signals.append(denoised_sig)
+    for ts, inter_sig, fn in zip(
+        extracted_time_series, interpolated_signals, func_filename
+    ):
+        if output is not None and reports == "inline":
+            with PLOT_LOCK:
+                plot_interpolation(ts, inter_sig, fn, output, fast=fast_plots)
+        elif output is not None and reports == "deferred":
+            queue_reports(
+                output,
+                [
+                    {
+                        "kind": "interpolation",
+                        "filename": fn,
+                        "ts": ts,
+                        "interpolated_ts": inter_sig,
+                        "fast": fast_plots,
+                    }
+                ],
+            )
 
     return denoised_signals, interpolated_confounds
 
@@ -359,6 +620,12 @@ def extract_and_denoise_timeseries(
     motion: Optional[str] = None,
     t_r: Optional[float] = None,
     output: Optional[str] = None,
+    n_jobs: int = 1,
+    memory: Optional[str] = None,
+    atlas_cache_dir: Optional[str] = None,
+    block_size: Optional[int] = None,
+    fast_plots: bool = False,
+    reports: str = "inline",
     **kwargs,
 ) -> tuple[list[np.ndarray], list, list[np.ndarray]]:
     """Extract and denoise regional timeseries for a given atlas.
@@ -384,56 +651,93 @@ def extract_and_denoise_timeseries(
         Repetition time of the MRI, by default None
     output : Optional[str], optional
         Path to the output directory, by default None
+    n_jobs : int, optional
+        Number of workers of the masker, by default 1
+    memory : Optional[str], optional
+        Path to the cache directory, by default None. If provided, the raw regional
+        signals and the parsed confounds are cached, and the signals are denoised in
+        memory.
+    atlas_cache_dir : Optional[str], optional
+        Path to the directory of resampled atlases, by default None. If provided, the
+        atlas is resampled only once per grid of the functional files.
+    block_size : Optional[int], optional
+        Number of volumes read at once, by default None. If provided, the images are
+        streamed by blocks instead of being loaded whole by the masker.
+    fast_plots : bool, optional
+        Draw the interpolation plots as rasterized LineCollections, by default False
+    reports : str, optional
+        Render the interpolation plots ("inline"), queue them ("deferred") or skip
+        them ("none"), by default "inline"
 
     Returns
     -------
-    tuple[list[np.ndarray], list]
-        Two lists, one with the extracted and denoised timeseries and one with the
-        corresponding confounds.
+    tuple[list[np.ndarray], list, list[np.ndarray]]
+        Three lists, one with the extracted and denoised timeseries, one with the
+        corresponding confounds and one with the sample masks.
     """
     if not len(func_filename):
         return [], [], []
 
     logging.info(f"Extracting and denoising timeseries for {len(func_filename)} files.")
+
+    if atlas_cache_dir is not None:
+        # Files of a group share their voxel size and TR but not necessarily their
+        # grid, so the atlas is resampled once per distinct grid (affine and shape)
+        resampled_atlases = [
+            get_resampled_atlas(atlas_filename, filename, atlas_cache_dir)
+            for filename in func_filename
+        ]
+        grid_atlases = list(dict.fromkeys(resampled_atlases))
+        if len(grid_atlases) > 1:
+            logging.info(
+                f"The {len(func_filename)} files lie on {len(grid_atlases)} grids, "
+                "processing each grid separately."
+            )
+            outputs_by_file = {}
+            for grid_atlas in grid_atlases:
+                indices = [
+                    i
+                    for i, resampled in enumerate(resampled_atlases)
+                    if resampled == grid_atlas
+                ]
+                grid_outputs = extract_and_denoise_timeseries(
+                    [func_filename[i] for i in indices],
+                    grid_atlas,
+                    verbose=verbose,
+                    interpolate=interpolate,
+                    low_pass=low_pass,
+                    denoising_strategy=denoising_strategy,
+                    motion=motion,
+                    t_r=t_r,
+                    output=output,
+                    n_jobs=n_jobs,
+                    memory=memory,
+                    block_size=block_size,
+                    fast_plots=fast_plots,
+                    reports=reports,
+                    **kwargs,
+                )
+                outputs_by_file.update(zip(indices, zip(*grid_outputs)))
+            time_series, confounds, sample_mask = zip(
+                *(outputs_by_file[i] for i in range(len(func_filename)))
+            )
+            return list(time_series), list(confounds), list(sample_mask)
+        atlas_filename = grid_atlases[0]
     logging.debug(f"Denoising strategy includes : {' '.join(denoising_strategy)}")
     logging.debug(f"Denoising parameters are: {kwargs}")
 
-    # There is currently a bug in nilearn that prevents "load_confounds" from finding
-    # the confounds file if it contains any other BIDS entity than "ses" and "run".
-    # It should be fixed in release 0.13.
-    try:
-        confounds, sample_mask = load_confounds(
-            func_filename,
-            demean=False,
-            strategy=denoising_strategy,
-            motion=motion,
-            **kwargs,
-        )
-    except ValueError as msg:
-        if "Could not find associated confound file. " not in str(msg):
-            raise
-
-        logging.warning(
-            "Nilearn could not find the confounds file (this is likely due to a"
-            " bug in nilearn.interface.fmriprep.load_confounds that should be fixed in"
-            " release 0.13, see nilearn issue #3792)."
-        )
-        logging.warning("Searching manually ...")
-
-        confounds, sample_mask = get_confounds_manually(
-            func_filename,
-            demean=False,
-            strategy=denoising_strategy,
-            motion=motion,
-            **kwargs,
-        )
-
-    # The outputs of "load_confounds" will not be in a list if
-    # "func_filename" is a list with one element.
-    if not isinstance(confounds, list):
-        confounds = [confounds]
-    if not isinstance(sample_mask, list):
-        sample_mask = [sample_mask]
+    # Only the columns required by the strategy are parsed, concurrently. This also
+    # works around a bug of nilearn (< 0.13) that prevents "load_confounds" from
+    # finding the confounds file if it contains other BIDS entities than "ses" and
+    # "run" (see nilearn issue #3792).
+    confounds, sample_mask = load_confounds_parallel(
+        func_filename,
+        cache_dir=memory,
+        demean=False,
+        strategy=denoising_strategy,
+        motion=motion,
+        **kwargs,
+    )
 
     if interpolate:
         time_series, confounds = interpolate_and_denoise_timeseries(
@@ -445,8 +749,41 @@ def extract_and_denoise_timeseries(
             low_pass=low_pass,
             output=output,
             verbose=verbose,
+            n_jobs=n_jobs,
+            memory=memory,
+            block_size=block_size,
+            fast_plots=fast_plots,
+            reports=reports,
         )
-        return time_series, confounds
+        return time_series, confounds, sample_mask
+
+    if memory is not None or block_size is not None:
+        # Fast path: denoise the raw signals in memory, as the masker would
+        time_series = [
+            clean(
+                raw_signals,
+                detrend=False,
+                standardize="zscore_sample",
+                standardize_confounds=True,
+                confounds=conf,
+                sample_mask=sm,
+                low_pass=low_pass,
+                t_r=t_r,
+            )
+            for raw_signals, conf, sm in zip(
+                extract_raw_signals(
+                    func_filename,
+                    atlas_filename,
+                    memory,
+                    verbose=verbose,
+                    n_jobs=n_jobs,
+                    block_size=block_size or DEFAULT_BLOCK_SIZE,
+                ),
+                confounds,
+                sample_mask,
+            )
+        ]
+        return time_series, confounds, sample_mask
 
     time_series = fit_transform_patched(
         func_filename,
@@ -458,12 +795,47 @@ def extract_and_denoise_timeseries(
         standardize="zscore_sample",
         verbose=verbose,
         reports=True,
-        n_jobs=8,
+        n_jobs=n_jobs,
     )
 
     return time_series, confounds, sample_mask
 
 
+def allocate_n_jobs(group_sizes: list[int], n_jobs: int) -> list[int]:
+    """Divide a budget of workers between groups of files according to their size.
+
+    Every non-empty group gets at least one worker, the remaining workers are handed
+    out one at a time to the group with the most files per worker. A group never
+    gets more workers than files.
+
+    Parameters
+    ----------
+    group_sizes : list[int]
+        Number of files in each group
+    n_jobs : int
+        Total number of workers
+
+    Returns
+    -------
+    list[int]
+        Number of workers of each group (0 for empty groups).
+    """
+    n_jobs_per_group = [int(size > 0) for size in group_sizes]
+    n_remaining = n_jobs - sum(n_jobs_per_group)
+
+    while n_remaining > 0:
+        candidates = [
+            i for i, size in enumerate(group_sizes) if n_jobs_per_group[i] < size
+        ]
+        if not candidates:
+            break
+        i = max(candidates, key=lambda i: group_sizes[i] / n_jobs_per_group[i])
+        n_jobs_per_group[i] += 1
+        n_remaining -= 1
+
+    return n_jobs_per_group
+
+
 def get_fc_strategy(
     strategy: str = "sparse inverse covariance",
 ) -> tuple[Union[GraphicalLassoCV, LedoitWolf], str, str]:
@@ -500,7 +872,11 @@ def compute_connectivity(
     time_series: list[np.ndarray],
     estimator: Union[LedoitWolf, GraphicalLassoCV] = LedoitWolf(store_precision=False),
     connectivity_kind: str = "correlation",
-) -> list[np.ndarray]:
+    n_jobs: int = 1,
+    shared_alpha: bool = False,
+    warm_start: bool = False,
+    group_estimate: Optional[tuple[float, np.ndarray]] = None,
+) -> tuple[list[np.ndarray], pd.DataFrame]:
     """Compute the functional connectivity using the specified estimator and
     connectivity kind.
 
@@ -513,28 +889,49 @@ def compute_connectivity(
         by default LedoitWolf(store_precision=False)
     connectivity_kind : str, optional
         Type of connectivity to compute, by default "correlation"
+    n_jobs : int, optional
+        Number of sessions fitted in parallel, by default 1
+    shared_alpha : bool, optional
+        Select the sparsity once on the pooled timeseries, by default False
+    warm_start : bool, optional
+        Start each fit from the group-average estimate, by default False
+    group_estimate : Optional[tuple[float, np.ndarray]], optional
+        Shared alpha and group-average covariance to reuse, by default None
 
     Returns
     -------
-    list[np.ndarray]
-        List of functional connectivity matrices
+    tuple[list[np.ndarray], pd.DataFrame]
+        List of functional connectivity matrices and the report (convergence and
+        timing) of each fit
     """
     if not len(time_series):
-        return []
-    n_ts = len(time_series)
-    n_area = time_series[0].shape[-1]
+        return [], pd.DataFrame()
     logging.info(
-        f"Computing functional connectivity matrices for {n_ts} timeseries ..."
+        f"Computing functional connectivity matrices for {len(time_series)} "
+        "timeseries ..."
+    )
+
+    fc_matrices, fit_report = compute_connectivity_batch(
+        time_series,
+        estimator,
+        connectivity_kind=connectivity_kind,
+        n_jobs=n_jobs,
+        shared_alpha=shared_alpha,
+        warm_start=warm_start,
+        group_estimate=group_estimate,
     )
 
-    connectivity_estimator = ConnectivityMeasure(
-        cov_estimator=estimator,
-        kind=connectivity_kind,
-        vectorize=True,
-        discard_diagonal=True,
+    n_unconverged = int((~fit_report["converged"].astype(bool)).sum())
+    if n_unconverged:
+        logging.warning(
+            f"{n_unconverged} out of {len(time_series)} connectivity fits did not "
+            "converge."
+        )
+    logging.info(
+        f"Connectivity fits took {fit_report['duration'].sum():.1f}s in total "
+        f"(max {fit_report['duration'].max():.1f}s per session)."
     )
-    connectivity_measures = connectivity_estimator.fit_transform(time_series)
-    return vec_to_sym_matrix(connectivity_measures, diagonal=np.zeros((n_ts, n_area)))
+    return list(fc_matrices), fit_report
 
 
 def main():
@@ -543,11 +940,13 @@ def main():
     input_path = args.data_dir
     output = args.output
     study_name = args.study_name
+    output_format = args.output_format
 
     ses_filter = args.ses
     task_filter = args.task
     run_filter = args.run
     overwrite = args.overwrite
+    layout_db = args.layout_db
 
     # denoise_only = args.denoise_only
     atlas_dimension = args.atlas_dimension
@@ -559,6 +958,13 @@ def main():
     scrub = args.n_scrub_frames
     fc_estimator = args.fc_estimator
     interpolate = args.no_censor
+    n_jobs = args.n_jobs
+    cache_dir = args.cache_dir
+    shared_alpha = args.shared_alpha
+    warm_start = args.warm_start
+    incremental = args.incremental
+    fast_plots = args.fast_plots
+    reports = args.reports
 
     verbosity_level = args.verbosity
     nilearn_verbose = verbosity_level - 1
@@ -584,6 +990,7 @@ def main():
         task_filter=task_filter,
         ses_filter=ses_filter,
         run_filter=run_filter,
+        database_path=layout_db,
     )
     all_filenames = list(chain.from_iterable(func_filenames))
     logging.info(f"Found {len(all_filenames)} functional file(s):")
@@ -609,9 +1016,35 @@ def main():
         )
     logging.info(f"Output will be save as derivatives in:\n\t{output}")
 
+    # Resampled atlases are shared by all the functional connectivity derivatives
+    atlas_cache_dir = op.join(
+        find_derivative(input_path), "functional_connectivity", ATLAS_CACHE_DIRNAME
+    )
+
     covar_estimator, fc_kind, fc_label = get_fc_strategy(fc_estimator)
     logging.info(f"'{fc_label}' has been selected as connectivity metric")
 
+    # Parameters recorded in the provenance manifest, outputs are only reused if they
+    # were computed with the same parameters
+    timeseries_params = {
+        "atlas": f"DiFuMo{atlas_dimension:d}",
+        "denoising_strategy": denoising_strategy,
+        "motion": motion,
+        "fd_threshold": fd_threshold,
+        "std_dvars_threshold": std_dvars_threshold,
+        "scrub": scrub,
+        "low_pass": low_pass,
+        "interpolate": interpolate,
+    }
+    fc_params = {
+        **timeseries_params,
+        "estimator": repr(covar_estimator),
+        "kind": fc_kind,
+        "shared_alpha": shared_alpha,
+        "incremental": incremental,
+        "warm_start": warm_start,
+    }
+
     # By default, the timeseries and FC of all filenames in input will be computed
     if not overwrite:
         logging.debug("Looking for existing timeseries ...")
@@ -619,6 +1052,7 @@ def main():
             output,
             all_filenames,
             return_existing=True,
+            params=timeseries_params,
             patterns=TIMESERIES_PATTERN,
             **TIMESERIES_FILLS,
         )
@@ -626,7 +1060,12 @@ def main():
         logging.info(f"{len(all_missing_ts)} files are missing timeseries.")
         logging.debug("Looking for existing fc matrices ...")
         missing_only_fc = check_existing_output(
-            output, all_existing_ts, patterns=FC_PATTERN, meas=fc_label, **FC_FILLS
+            output,
+            all_existing_ts,
+            params=fc_params,
+            patterns=FC_PATTERN,
+            meas=fc_label,
+            **FC_FILLS,
         )
         logging.info(
             f"{len(all_missing_ts + missing_only_fc)} files are missing FC matrices."
@@ -644,11 +1083,17 @@ def main():
     sorted_missing_ts = list(chain.from_iterable(separated_missing_ts))
     missing_something = sorted_missing_ts + missing_only_fc
 
-    time_series = []
-    all_confounds = []
-    all_sample_masks = []
-    for filenames_to_ts, t_r in zip(separated_missing_ts, t_r_list):
-        ts, conf, mask = extract_and_denoise_timeseries(
+    # Process the groups of files with similar FoV and TR concurrently, sharing the
+    # budget of workers between and within the groups
+    group_n_jobs = allocate_n_jobs(
+        [len(filenames_to_ts) for filenames_to_ts in separated_missing_ts], n_jobs
+    )
+    n_concurrent_groups = max(sum(n > 0 for n in group_n_jobs), 1)
+    logging.debug(f"Workers allocated to each group of files: {group_n_jobs}")
+    group_outputs = Parallel(
+        n_jobs=min(n_concurrent_groups, n_jobs), backend="threading"
+    )(
+        delayed(extract_and_denoise_timeseries)(
             filenames_to_ts,
             atlas_filename,
             verbose=nilearn_verbose,
@@ -661,10 +1106,27 @@ def main():
             scrub=scrub,
             interpolate=interpolate,
             output=output,
+            n_jobs=max(n_group_jobs, 1),
+            memory=cache_dir,
+            atlas_cache_dir=atlas_cache_dir,
+            block_size=args.block_size,
+            fast_plots=fast_plots,
+            reports=reports,
+        )
+        for filenames_to_ts, t_r, n_group_jobs in zip(
+            separated_missing_ts, t_r_list, group_n_jobs
         )
+    )
+
+    time_series = []
+    all_confounds = []
+    all_sample_masks = []
+    all_t_rs = []
+    for (ts, conf, mask), t_r in zip(group_outputs, t_r_list):
         time_series += ts
         all_confounds += conf
         all_sample_masks += mask
+        all_t_rs += [t_r] * len(ts)
 
     # Saving aggregated/denoised timeseries and visual reports
     if len(time_series):
@@ -674,31 +1136,45 @@ def main():
             time_series,
             sorted_missing_ts,
             output,
+            output_format=output_format,
+            params=timeseries_params,
             patterns=TIMESERIES_PATTERN,
             **TIMESERIES_FILLS,
         )
 
-        for individual_time_serie, confounds, filename in zip(
-            time_series, all_confounds, sorted_missing_ts
-        ):
-            visual_report_timeserie(
-                individual_time_serie,
-                filename=filename,
-                output=output,
-                confounds=confounds,
-                labels=atlas_labels,
-                networks=atlas_network,
-            )
+    # Group-level terms of the estimation, which the incremental mode reuses so that
+    # only the new sessions are estimated
+    fc_time_series = time_series + existing_timeseries
+    new_sessions = [op.basename(filename) for filename in missing_something]
+    connectivity_state = load_connectivity_state(output, fc_label)
+    group_estimate = None
+    if incremental:
+        group_estimate = load_group_estimate(connectivity_state, output)
+
+    new_group = None
+    if group_estimate is not None:
+        logging.info("Reusing the group-level terms recorded by previous runs.")
+    elif (
+        shared_alpha
+        and len(fc_time_series)
+        and isinstance(covar_estimator, GraphicalLassoCV)
+    ):
+        group_estimate = fit_group_estimate(fc_time_series, covar_estimator)
+        new_group = {"alpha": group_estimate[0], "sessions": new_sessions}
 
-    fc_matrices = compute_connectivity(
-        time_series + existing_timeseries,
+    fc_matrices, fit_report = compute_connectivity(
+        fc_time_series,
         estimator=covar_estimator,
         connectivity_kind=fc_kind,
+        n_jobs=n_jobs,
+        shared_alpha=shared_alpha,
+        warm_start=warm_start,
+        group_estimate=group_estimate,
     )
 
     # Compute duration of fMRI scans after censoring
     fMRI_duration_after_censoring = {}
-    for filename, mask in zip(all_filenames, all_sample_masks):
+    for filename, mask, t_r in zip(sorted_missing_ts, all_sample_masks, all_t_rs):
         fMRI_duration_after_censoring[op.basename(filename)] = mask.shape[0] * t_r
         # mask.shape[0] indicates the number of volumes that are not censored
     with open(
@@ -717,20 +1193,89 @@ def main():
             fc_matrices,
             missing_something,
             output,
+            output_format=output_format,
+            params=fc_params,
             patterns=FC_PATTERN,
             meas=fc_label,
             **FC_FILLS,
         )
+        store_path = append_group_store(
+            fc_matrices, missing_something, output, meas=fc_label
+        )
+        logging.info(f"Group store of connectivity matrices updated: {store_path}")
+
+        # Keep track of the convergence and timing of each fit
+        fit_report.insert(0, "filename", [op.basename(f) for f in missing_something])
+        report_path = op.join(output, f"fit_report_meas-{fc_label}.tsv")
+        fit_report.to_csv(
+            report_path,
+            sep="\t",
+            index=False,
+            mode="a",
+            header=not op.exists(report_path),
+        )
+
+        # Record the new sessions and which group-level terms they make stale
+        connectivity_state = update_connectivity_state(
+            connectivity_state, new_sessions, group=new_group
+        )
+        save_connectivity_state(
+            connectivity_state,
+            output,
+            fc_label,
+            group_covariance=None if new_group is None else group_estimate[1],
+        )
+        if connectivity_state["stale"]:
+            logging.info(
+                "Group-level terms to refresh: "
+                f"{', '.join(connectivity_state['stale'])}"
+            )
 
-        # Generate session-specific figures
-        for individual_matrix, filename in zip(fc_matrices, missing_something):
-            visual_report_fc(
-                individual_matrix,
-                filename=filename,
-                output=output,
-                labels=atlas_labels,
-                meas=fc_label,
+    # Generate session-specific figures from the saved outputs
+    sessions = [
+        {"filename": filename, "meas": fc_label}
+        for filename in sorted_missing_ts + missing_only_fc
+    ]
+    for session, confounds in zip(sessions, all_confounds):
+        session["confounds"] = confounds
+        session["timeseries_path"] = op.join(
+            output,
+            get_bids_savename(
+                session["filename"], patterns=TIMESERIES_PATTERN, **TIMESERIES_FILLS
+            ),
+        )
+    if len(fc_matrices):
+        for session in sessions:
+            session["fc_path"] = op.join(
+                output,
+                get_bids_savename(
+                    session["filename"],
+                    patterns=FC_PATTERN,
+                    meas=fc_label,
+                    **FC_FILLS,
+                ),
             )
+    if reports == "inline":
+        render_reports(
+            sessions,
+            output,
+            labels=atlas_labels,
+            networks=atlas_network,
+            n_jobs=n_jobs,
+            fast=fast_plots,
+        )
+    elif reports == "deferred":
+        queue_path = queue_reports(
+            output,
+            [
+                {"kind": "session", "fast": fast_plots, **session}
+                for session in sessions
+            ],
+        )
+        logging.info(
+            f"Visual reports queued in {queue_path}, render them with "
+            "funconn_reports.py --queue."
+        )
 
     logging.info(
         f"Computation is done for {len(missing_something)} files out of the "
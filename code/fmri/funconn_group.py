@@ -24,7 +24,6 @@
 import argparse
 import logging
 
-import numpy as np
 import os.path as op
 import pandas as pd
 
@@ -39,7 +38,11 @@ from load_save import (
     check_existing_output,
     get_bids_savename,
     get_func_filenames_bids,
+    get_connectivity_state_path,
+    load_connectivity_state,
+    load_fc_edges,
     load_iqms,
+    save_connectivity_state,
 )
 
 from reports import (
@@ -78,6 +81,30 @@ def get_arguments() -> argparse.Namespace:
         help="""type of connectivity to compute (can be 'correlation', 'covariance' or
         'sparse')""",
     )
+    parser.add_argument(
+        "--streaming-null",
+        default=True,
+        action=argparse.BooleanOptionalAction,
+        help="accumulate the QC-FC null distribution in a fixed-bin histogram "
+        "(bounded memory). With --no-streaming-null, every null correlation is kept "
+        "(n_edges x 10000 floats per IQM): exact, but memory-bound, several GB for "
+        "large atlases",
+    )
+    parser.add_argument(
+        "--n-jobs",
+        default=-1,
+        action="store",
+        type=int,
+        help="number of processes computing the QC-FC statistics (by default, -1 "
+        "for all CPUs)",
+    )
+    parser.add_argument(
+        "--layout-db",
+        default=None,
+        action="store",
+        help="folder where the BIDS layout database is persisted and reused "
+        "(by default, under ~/.cache/hcph-funconn)",
+    )
     parser.add_argument(
         "-v",
         "--verbosity",
@@ -98,6 +125,9 @@ def main():
     task_filter = args.task
     mriqc_path = args.mriqc_path
     fc_label = args.fc_estimator.replace(" ", "")
+    streaming_null = args.streaming_null
+    n_jobs = args.n_jobs
+    layout_db = args.layout_db
 
     verbosity_level = args.verbosity
 
@@ -124,7 +154,9 @@ def main():
 
     # Find all existing functional connectivity
     input_path = find_derivative(output)
-    func_filenames, _ = get_func_filenames_bids(input_path, task_filter=task_filter)
+    func_filenames, _ = get_func_filenames_bids(
+        input_path, task_filter=task_filter, database_path=layout_db
+    )
     all_filenames = list(chain.from_iterable(func_filenames))
 
     existing_fc = check_existing_output(
@@ -147,10 +179,9 @@ def main():
             f"No functional connectivity of type {filename} were found. Please revise the arguments."
         )
 
-    # Load functional connectivity matrices
-    fc_matrices = []
-    for file_path in existing_fc:
-        fc_matrices.append(np.loadtxt(file_path, delimiter="\t"))
+    # Load the upper triangles of the connectivity matrices, from the group store if
+    # available
+    fc_matrices = load_fc_edges(existing_fc, output, fc_label)
 
     # Load fMRI duration after censoring
     good_timepoints_df = pd.read_csv(
@@ -167,8 +198,17 @@ def main():
         iqms_df,
         atlas_filename,
         output,
+        streaming=streaming_null,
+        n_jobs=n_jobs,
     )
 
+    # The group report is now up to date with the estimated sessions
+    if op.exists(get_connectivity_state_path(output, fc_label)):
+        connectivity_state = load_connectivity_state(output, fc_label)
+        if "group_report" in connectivity_state["stale"]:
+            connectivity_state["stale"].remove("group_report")
+            save_connectivity_state(connectivity_state, output, fc_label)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,233 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2023 The Axon Lab <theaxonlab@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Render the per-session visual reports from the outputs of funconn.py.
+
+The figures are drawn from the saved timeseries and connectivity matrices, so the
+reports can be regenerated without recomputing anything. Figures more recent than
+their inputs are skipped, unless --force is given. With --queue, the plots queued
+by ``funconn.py --reports deferred`` are rendered instead.
+
+    python funconn_reports.py /data/derivatives/functional_connectivity/DiFuMo64-LP
+"""
+
+import argparse
+import logging
+import os.path as op
+from itertools import chain
+
+from funconn import NETWORK_MAPPING, get_fc_strategy
+
+from load_save import (
+    check_existing_output,
+    find_atlas_dimension,
+    find_derivative,
+    get_atlas_data,
+    get_bids_savename,
+    get_func_filenames_bids,
+    FC_FILLS,
+    FC_PATTERN,
+    TIMESERIES_FILLS,
+    TIMESERIES_PATTERN,
+)
+
+from reports import render_queued_reports, render_reports
+
+
+def get_arguments() -> argparse.Namespace:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="""Render the per-session visual reports of functional
+        connectivity from the saved outputs.""",
+    )
+
+    # Input/Output arguments and options
+    parser.add_argument(
+        "output",
+        help="path to the directory where the functional connectivity outputs are "
+        "stored",
+    )
+    parser.add_argument(
+        "--task",
+        default=["rest"],
+        action="store",
+        nargs="+",
+        help="a space delimited list of task(s)",
+    )
+    parser.add_argument(
+        "--fc-estimator",
+        default="sparse inverse covariance",
+        action="store",
+        choices=["correlation", "covariance", "sparse", "sparse inverse covariance"],
+        type=str,
+        help="""type of connectivity to compute (can be 'correlation', 'covariance' or
+        'sparse')""",
+    )
+    parser.add_argument(
+        "--force",
+        default=False,
+        action="store_true",
+        help="render all the figures, even those more recent than their inputs",
+    )
+    parser.add_argument(
+        "--queue",
+        default=False,
+        action="store_true",
+        help="render the plots queued by funconn.py --reports deferred, instead of "
+        "the reports of all the saved outputs",
+    )
+    parser.add_argument(
+        "--fast-plots",
+        default=False,
+        action="store_true",
+        help="draw the signal plots as a single rasterized artist (recommended for "
+        "large atlases)",
+    )
+    parser.add_argument(
+        "--n-jobs",
+        default=8,
+        action="store",
+        type=int,
+        help="number of processes rendering the figures",
+    )
+    parser.add_argument(
+        "--layout-db",
+        default=None,
+        action="store",
+        help="folder where the BIDS layout database is persisted and reused "
+        "(by default, under ~/.cache/hcph-funconn)",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbosity",
+        action="count",
+        default=1,
+        help="""increase output verbosity (-v: standard logging infos; -vv: logging
+        infos and NiLearn verbose; -vvv: debug)""",
+    )
+
+    args = parser.parse_args()
+
+    return args
+
+
+def main():
+    args = get_arguments()
+    output = args.output
+    task_filter = args.task
+    _, _, fc_label = get_fc_strategy(args.fc_estimator)
+    force = args.force
+    queue = args.queue
+    fast_plots = args.fast_plots
+    n_jobs = args.n_jobs
+    layout_db = args.layout_db
+
+    verbosity_level = args.verbosity
+
+    logging_level_map = {
+        0: logging.WARN,
+        1: logging.INFO,
+        2: logging.INFO,
+        3: logging.DEBUG,
+    }
+
+    logging.basicConfig(
+        format="%(levelname)s: %(message)s",
+        level=logging_level_map[min([verbosity_level, 3])],
+    )
+
+    logging.captureWarnings(True)
+
+    # Find the atlas dimension from the output path
+    atlas_dimension = find_atlas_dimension(output)
+    atlas_data = get_atlas_data(dimension=atlas_dimension)
+    atlas_labels = getattr(atlas_data, "labels").loc[:, "difumo_names"]
+    atlas_network = getattr(atlas_data, "labels").loc[:, NETWORK_MAPPING]
+
+    if queue:
+        render_queued_reports(
+            output,
+            labels=atlas_labels,
+            networks=atlas_network,
+            n_jobs=n_jobs,
+            force=force,
+        )
+        return
+
+    # Find the sessions with saved outputs
+    input_path = find_derivative(output)
+    func_filenames, _ = get_func_filenames_bids(
+        input_path, task_filter=task_filter, database_path=layout_db
+    )
+    all_filenames = list(chain.from_iterable(func_filenames))
+
+    _, with_timeseries = check_existing_output(
+        output,
+        all_filenames,
+        return_existing=True,
+        patterns=TIMESERIES_PATTERN,
+        **TIMESERIES_FILLS,
+    )
+    _, with_fc = check_existing_output(
+        output,
+        all_filenames,
+        return_existing=True,
+        patterns=FC_PATTERN,
+        meas=fc_label,
+        **FC_FILLS,
+    )
+
+    sessions = []
+    for filename in all_filenames:
+        session = {"filename": filename, "meas": fc_label}
+        if filename in with_timeseries:
+            session["timeseries_path"] = op.join(
+                output,
+                get_bids_savename(
+                    filename, patterns=TIMESERIES_PATTERN, **TIMESERIES_FILLS
+                ),
+            )
+        if filename in with_fc:
+            session["fc_path"] = op.join(
+                output,
+                get_bids_savename(
+                    filename, patterns=FC_PATTERN, meas=fc_label, **FC_FILLS
+                ),
+            )
+        if len(session) > 2:
+            sessions.append(session)
+
+    logging.info(
+        f"Found outputs for {len(sessions)} out of {len(all_filenames)} files."
+    )
+    render_reports(
+        sessions,
+        output,
+        labels=atlas_labels,
+        networks=atlas_network,
+        n_jobs=n_jobs,
+        force=force,
+        fast=fast_plots,
+    )
+
+
+if __name__ == "__main__":
+    main()
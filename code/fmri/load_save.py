@@ -24,21 +24,45 @@
 
 import os
 import re
+import json
+import inspect
+import hashlib
+import sqlite3
+import tempfile
+import time
 import os.path as op
+from glob import glob
+from itertools import chain
 import pandas as pd
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from string import Formatter
+from threading import Lock
 import logging
 from typing import Optional, Union
 
 from bids import BIDSLayout
+import h5py
 import numpy as np
 
 from pandas import read_csv
-from nibabel import loadsave
+from nibabel import Nifti1Header, loadsave
+from nibabel.openers import ImageOpener
 from bids.layout import parse_file_entities
 from bids.layout.writing import build_path
 from nilearn.datasets import fetch_atlas_difumo
-from nilearn.interfaces.fmriprep.load_confounds import _load_single_confounds_file
+from nilearn.image import resample_img
+from nilearn.interfaces.fmriprep import load_confounds
+from nilearn.interfaces.fmriprep.load_confounds import (
+    _check_error,
+    _load_noise_component,
+)
+from nilearn.interfaces.fmriprep.load_confounds_utils import (
+    _get_file_name,
+    _load_confounds_json,
+    _prepare_output,
+)
 
 FC_PATTERN: list = [
     "sub-{subject}[/ses-{session}]/func/sub-{subject}"
@@ -60,6 +84,55 @@ CONFOUND_PATTERN: list = [
 ]
 CONFOUND_FILLS: dict = {"desc": "confounds", "suffix": "timeseries", "extension": "tsv"}
 
+FIGURE_PATTERN: list = [
+    "sub-{subject}/figures/sub-{subject}[_ses-{session}]"
+    "[_task-{task}][_meas-{meas}][_desc-{desc}]"
+    "_{suffix}{extension}",
+    "sub-{subject}/figures/sub-{subject}[_ses-{session}]"
+    "[_task-{task}][_desc-{desc}]_{suffix}{extension}",
+]
+FIGURE_FILLS: dict = {"extension": "png"}
+
+LAYOUT_CACHE_DIR: str = op.join(
+    os.getenv("XDG_CACHE_HOME", op.join(op.expanduser("~"), ".cache")),
+    "hcph-funconn",
+    "bids-layouts",
+)
+LAYOUT_FINGERPRINT_FILENAME: str = "fingerprint.json"
+HEADER_CACHE_FILENAME: str = "headers.json"
+N_HEADER_THREADS: int = 8
+
+RAW_SIGNALS_DIRNAME: str = "raw_signals"
+CONFOUNDS_CACHE_DIRNAME: str = "confounds"
+N_CONFOUNDS_THREADS: int = 8
+# Substrings of the fMRIPrep confound names read for each denoising component
+CONFOUND_KEYWORDS: dict = {
+    "non_steady_state": ("non_steady_state",),
+    "motion": ("trans_", "rot_"),
+    "high_pass": ("cosine",),
+    "wm_csf": ("csf", "white_matter"),
+    "global_signal": ("global_signal",),
+    "compcor": ("comp_cor",),
+    "ica_aroma": ("aroma",),
+    "scrub": ("framewise_displacement", "std_dvars"),
+}
+# Parameters of nilearn's load_confounds that are not given are set to its defaults
+LOAD_CONFOUNDS_DEFAULTS: dict = {
+    name: parameter.default
+    for name, parameter in inspect.signature(load_confounds).parameters.items()
+    if parameter.default is not inspect.Parameter.empty
+}
+ATLAS_CACHE_DIRNAME: str = "atlases"
+CONNECTIVITY_STATE_FILENAME: str = "connectivity_state_meas-{meas}.json"
+GROUP_COVARIANCE_FILENAME: str = "group_covariance_meas-{meas}.npy"
+MANIFEST_FILENAME: str = "provenance.sqlite"
+
+BINARY_EXTENSION: str = ".npy"
+OUTPUT_FORMATS: tuple = ("tsv", "npy", "both")
+
+GROUP_STORE_FILENAME: str = "group_meas-{meas}_connectivity.h5"
+GROUP_STORE_ENTITIES: tuple = ("subject", "session", "task", "run")
+
 
 def separate_by_similar_values(
     input_list: list, external_value: Optional[Union[list, np.ndarray]] = None
@@ -90,11 +163,206 @@ def separate_by_similar_values(
     return data_by_value
 
 
+def get_layout_fingerprint(root: str) -> dict:
+    """Return the modification times of the folders of a BIDS dataset down to the
+    datatype level (e.g. ``sub-01/ses-01/func``). Adding, removing or renaming a file
+    changes the modification time of its parent folder.
+
+    Parameters
+    ----------
+    root : str
+        Path to the BIDS (usually derivatives) directory
+
+    Returns
+    -------
+    dict
+        Dictionary mapping the folders (relative to `root`) to their modification
+        times in nanoseconds.
+    """
+    folders = [root] + sorted(
+        glob(op.join(root, "sub-*", ""))
+        + glob(op.join(root, "sub-*", "ses-*", ""))
+        + glob(op.join(root, "sub-*", "*", ""))
+        + glob(op.join(root, "sub-*", "ses-*", "*", ""))
+    )
+    return {
+        op.relpath(folder, root): os.stat(folder).st_mtime_ns
+        for folder in dict.fromkeys(folders)
+    }
+
+
+def get_layout_database_path(root: str, database_path: Optional[str] = None) -> str:
+    """Return the folder where the layout database (and related caches) of a BIDS
+    dataset are persisted.
+
+    Parameters
+    ----------
+    root : str
+        Path to the BIDS (usually derivatives) directory
+    database_path : Optional[str], optional
+        User-defined folder, by default a folder of LAYOUT_CACHE_DIR specific to
+        `root`
+
+    Returns
+    -------
+    str
+        Path to the database folder.
+    """
+    if database_path is not None:
+        return database_path
+    root_hash = hashlib.sha1(op.abspath(root).encode()).hexdigest()[:16]
+    return op.join(LAYOUT_CACHE_DIR, root_hash)
+
+
+def get_bids_layout(root: str, database_path: Optional[str] = None) -> BIDSLayout:
+    """Return the BIDS layout of a dataset, reusing a persistent pybids database as
+    long as none of the subject/session folders changed since it was indexed.
+
+    Parameters
+    ----------
+    root : str
+        Path to the BIDS (usually derivatives) directory
+    database_path : Optional[str], optional
+        Folder where the layout database is stored, by default a folder of
+        LAYOUT_CACHE_DIR specific to `root`
+
+    Returns
+    -------
+    BIDSLayout
+        Layout of the dataset.
+    """
+    root = op.abspath(root)
+    database_path = get_layout_database_path(root, database_path)
+    fingerprint_file = op.join(database_path, LAYOUT_FINGERPRINT_FILENAME)
+
+    fingerprint = get_layout_fingerprint(root)
+    previous_fingerprint = {}
+    if op.exists(fingerprint_file):
+        with open(fingerprint_file) as f:
+            previous_fingerprint = json.load(f)
+
+    changed_folders = [
+        folder
+        for folder in set(fingerprint) | set(previous_fingerprint)
+        if fingerprint.get(folder) != previous_fingerprint.get(folder)
+    ]
+    if changed_folders:
+        logging.info(f"Indexing BIDS layout into {database_path} ...")
+        logging.debug(
+            f"\t{len(changed_folders)} folder(s) changed since last indexing:"
+            "\n\t" + "\n\t".join(sorted(changed_folders))
+        )
+    else:
+        logging.debug(f"Reusing BIDS layout indexed in {database_path}")
+
+    os.makedirs(database_path, exist_ok=True)
+    layout = BIDSLayout(
+        root,
+        validate=False,
+        database_path=database_path,
+        reset_database=bool(changed_folders),
+    )
+
+    if changed_folders:
+        with open(fingerprint_file, "w") as f:
+            json.dump(fingerprint, f)
+
+    return layout
+
+
+def load_nifti_header(filename: str) -> Nifti1Header:
+    """Read only the header bytes of a (possibly gzipped) NIfTI file.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the NIfTI file
+
+    Returns
+    -------
+    Nifti1Header
+        Header of the image.
+    """
+    try:
+        with ImageOpener(filename) as fileobj:
+            return Nifti1Header.from_fileobj(fileobj)
+    except Exception:
+        # Not a NIfTI-1 file (e.g. NIfTI-2), let nibabel find the right class
+        return loadsave.load(filename).header
+
+
+def get_affines_and_trs(
+    filenames: list[str],
+    layout: BIDSLayout,
+    cache_file: Optional[str] = None,
+    n_threads: int = N_HEADER_THREADS,
+) -> tuple[list[np.ndarray], list[float]]:
+    """Return the affine and the repetition time (TR) of functional files.
+
+    Headers are read without loading the images, concurrently with the metadata
+    lookups. Results are cached on disk and reused as long as the path, the size and
+    the modification time of the file did not change.
+
+    Parameters
+    ----------
+    filenames : list[str]
+        List of BIDS functional filenames
+    layout : BIDSLayout
+        Layout used to find the metadata of the files
+    cache_file : Optional[str], optional
+        Path to the JSON cache, by default None (no caching)
+    n_threads : int, optional
+        Number of threads, by default N_HEADER_THREADS
+
+    Returns
+    -------
+    tuple[list[np.ndarray], list[float]]
+        The list of affines and the list of TRs.
+    """
+    cache = {}
+    if cache_file is not None and op.exists(cache_file):
+        with open(cache_file) as f:
+            cache = json.load(f)
+
+    def _file_stat(filename):
+        stat = os.stat(filename)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    # pybids' database session cannot be shared between threads
+    layout_lock = Lock()
+
+    def _read(filename):
+        affine = load_nifti_header(filename).get_best_affine()
+        with layout_lock:
+            t_r = layout.get_metadata(filename)["RepetitionTime"]
+        return {"stat": _file_stat(filename), "affine": affine.tolist(), "t_r": t_r}
+
+    to_read = [
+        filename
+        for filename in filenames
+        if cache.get(filename, {}).get("stat") != _file_stat(filename)
+    ]
+    if to_read:
+        logging.debug(f"Reading the headers and metadata of {len(to_read)} files.")
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            cache.update(zip(to_read, executor.map(_read, to_read)))
+
+        if cache_file is not None:
+            os.makedirs(op.dirname(cache_file), exist_ok=True)
+            with open(cache_file, "w") as f:
+                json.dump(cache, f)
+
+    affines = [np.array(cache[filename]["affine"]) for filename in filenames]
+    t_rs = [cache[filename]["t_r"] for filename in filenames]
+    return affines, t_rs
+
+
 def get_func_filenames_bids(
     paths_to_func_dir: str,
     task_filter: Optional[list] = None,
     ses_filter: Optional[list] = None,
     run_filter: Optional[list] = None,
+    database_path: Optional[str] = None,
 ) -> tuple[list[list[str]], list[float]]:
     """Return the BIDS functional imaging files matching the specified task and session
     filters as well as the first (if multiple) unique repetition time (TR).
@@ -109,6 +377,9 @@ def get_func_filenames_bids(
         List of session name(s) to consider, by default `None`
     run_filter : list, optional
         List of run(s) to consider, by default `None`
+    database_path : str, optional
+        Folder where the BIDS layout database is persisted, by default `None`
+        (see :obj:`get_bids_layout`)
 
     Returns
     -------
@@ -117,10 +388,7 @@ def get_func_filenames_bids(
     """
     logging.debug("Using BIDS to find functional files...")
 
-    layout = BIDSLayout(
-        paths_to_func_dir,
-        validate=False,
-    )
+    layout = get_bids_layout(paths_to_func_dir, database_path=database_path)
 
     all_derivatives = layout.get(
         scope="all",
@@ -142,9 +410,15 @@ def get_func_filenames_bids(
             f"\nRun: {run_filter or []}"
         )
 
-    affines = []
-    for file in all_derivatives:
-        affines.append(loadsave.load(file).affine)
+    affines, t_rs = get_affines_and_trs(
+        all_derivatives,
+        layout,
+        cache_file=op.join(
+            get_layout_database_path(paths_to_func_dir, database_path),
+            HEADER_CACHE_FILENAME,
+        ),
+    )
+    t_r_by_file = dict(zip(all_derivatives, t_rs))
 
     similar_fov_dict = separate_by_similar_values(
         all_derivatives, np.array(affines)[:, 0, 0]
@@ -159,11 +433,9 @@ def get_func_filenames_bids(
     separated_files = []
     separated_trs = []
     for file_group in similar_fov_dict.values():
-        t_rs = []
-        for file in file_group:
-            t_rs.append(layout.get_metadata(file)["RepetitionTime"])
-
-        similar_tr_dict = separate_by_similar_values(file_group, t_rs)
+        similar_tr_dict = separate_by_similar_values(
+            file_group, [t_r_by_file[file] for file in file_group]
+        )
         separated_files += list(similar_tr_dict.values())
         separated_trs += list(similar_tr_dict.keys())
 
@@ -177,6 +449,108 @@ def get_func_filenames_bids(
     return separated_files, separated_trs
 
 
+@lru_cache(maxsize=None)
+def _parse_entities(filename: str) -> dict:
+    return parse_file_entities(filename)
+
+
+def parse_entities(filename: str) -> dict:
+    """Parse the BIDS entities of a filename, memoizing pybids' regex parsing.
+
+    Parameters
+    ----------
+    filename : str
+        Name of a BIDS file
+
+    Returns
+    -------
+    dict
+        BIDS entities of the file (a copy, that can be modified).
+    """
+    return dict(_parse_entities(str(filename)))
+
+
+class BidsPathBuilder:
+    """Build paths from BIDS path patterns that are parsed once.
+
+    This is equivalent to `bids.layout.writing.build_path` (non-strict) for patterns
+    made of entities (``{entity}``) and optional sections (``[...]``), such as
+    FC_PATTERN, TIMESERIES_PATTERN or CONFOUND_PATTERN. Patterns with value
+    selectors or defaults are handed to pybids.
+
+    Parameters
+    ----------
+    patterns : list
+        BIDS path patterns, tried in order
+    """
+
+    def __init__(self, patterns: list):
+        self.patterns = list(patterns)
+        self._compiled = None
+        if not any(char in "".join(self.patterns) for char in "<|"):
+            self._compiled = [self._compile(pattern) for pattern in self.patterns]
+
+    @staticmethod
+    def _compile(pattern: str) -> tuple[bool, list[tuple[bool, str, frozenset]]]:
+        """Split a pattern into (optional, format string, entities) sections."""
+        sections = []
+        for section in re.split(r"(\[.*?\])", pattern):
+            optional = section.startswith("[")
+            if optional:
+                section = section[1:-1]
+            fields = frozenset(
+                field for _, field, _, _ in Formatter().parse(section) if field
+            )
+            if section:
+                sections.append((optional, section, fields))
+        return bool(re.search(r"\.\{extension", pattern)), sections
+
+    def build(self, entities: dict) -> Optional[str]:
+        """Build the path of the first pattern whose entities are all defined.
+
+        Parameters
+        ----------
+        entities : dict
+            BIDS entities of the file
+
+        Returns
+        -------
+        Optional[str]
+            The path, None if no pattern matches the entities.
+        """
+        if self._compiled is None or any(
+            isinstance(value, (list, tuple)) for value in entities.values()
+        ):
+            return build_path(entities, self.patterns)
+
+        # Drop None and empty strings, keep zeros
+        entities = {k: v for k, v in entities.items() if v or v == 0}
+        for dot_extension, sections in self._compiled:
+            values = dict(entities)
+            if "extension" in values:
+                # Accept extensions with and without leading dot
+                extension = str(values["extension"]).lstrip(".")
+                values["extension"] = extension if dot_extension else f".{extension}"
+
+            path = []
+            for optional, section, fields in sections:
+                if optional and not fields & values.keys():
+                    continue
+                if not fields <= values.keys():
+                    break
+                path.append(section.format(**values))
+            else:
+                return "".join(path)
+
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_path_builder(patterns: tuple) -> BidsPathBuilder:
+    """Return the (shared) path builder of a tuple of BIDS path patterns."""
+    return BidsPathBuilder(patterns)
+
+
 def get_bids_savename(filename: str, patterns: list, **kwargs) -> str:
     """Return the BIDS filename following the specified patterns and modifying the
     entities from the keywords arguments.
@@ -193,16 +567,104 @@ def get_bids_savename(filename: str, patterns: list, **kwargs) -> str:
     str
         BIDS output filename.
     """
-    entity = parse_file_entities(filename)
+    entity = parse_entities(filename)
 
     for key, value in kwargs.items():
         entity[key] = value
 
-    bids_savename = build_path(entity, patterns)
+    bids_savename = get_path_builder(tuple(patterns)).build(entity)
 
     return str(bids_savename)
 
 
+def get_binary_sidecar(path: str) -> str:
+    """Return the path of the binary (.npy) sidecar of a TSV output.
+
+    Parameters
+    ----------
+    path : str
+        Path to the TSV output
+
+    Returns
+    -------
+    str
+        Path to the binary sidecar.
+    """
+    return re.sub(r"\.tsv$", "", str(path)) + BINARY_EXTENSION
+
+
+def output_exists(path: str) -> bool:
+    """Check whether an output exists, either as TSV or as binary sidecar.
+
+    Parameters
+    ----------
+    path : str
+        Path to the TSV output
+
+    Returns
+    -------
+    bool
+        True if the output or its binary sidecar exists.
+    """
+    return op.exists(path) or op.exists(get_binary_sidecar(path))
+
+
+def load_array(path: str) -> np.ndarray:
+    """Load an output array, memory-mapping the binary sidecar if it exists and is
+    not older than the TSV file, and parsing the TSV file otherwise.
+
+    Parameters
+    ----------
+    path : str
+        Path to the TSV output
+
+    Returns
+    -------
+    np.ndarray
+        Loaded array (read-only memory map if loaded from the binary sidecar).
+    """
+    binary_path = get_binary_sidecar(path)
+    # A sidecar older than the TSV file is stale (e.g., the TSV was overwritten)
+    if op.exists(binary_path) and (
+        not op.exists(path)
+        or os.stat(binary_path).st_mtime_ns >= os.stat(path).st_mtime_ns
+    ):
+        return np.load(binary_path, mmap_mode="r")
+    return np.genfromtxt(path, float, delimiter="\t")
+
+
+def get_raw_signals_path(
+    cache_dir: str, func_filename: str, atlas_filename: str
+) -> str:
+    """Return the path where the raw (not denoised) regional signals of a functional
+    file are cached.
+
+    The key combines the path, size and modification time of the functional file
+    with the path of the atlas, so that modified inputs are never served from cache.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Path to the cache directory
+    func_filename : str
+        BIDS functional filename
+    atlas_filename : str
+        Path to the atlas file
+
+    Returns
+    -------
+    str
+        Path to the cached signals (.npy).
+    """
+    stat = os.stat(func_filename)
+    key = hashlib.sha1(
+        f"{op.abspath(func_filename)}:{stat.st_size}:{stat.st_mtime_ns}:"
+        f"{op.abspath(atlas_filename)}".encode()
+    ).hexdigest()[:16]
+    name = op.basename(func_filename).split(".")[0]
+    return op.join(cache_dir, RAW_SIGNALS_DIRNAME, f"{name}_{key}{BINARY_EXTENSION}")
+
+
 def get_atlas_data(atlas_name: str = "DiFuMo", **kwargs) -> dict:
     """Fetch the specifies atlas filename and data.
 
@@ -227,6 +689,60 @@ def get_atlas_data(atlas_name: str = "DiFuMo", **kwargs) -> dict:
     return fetch_atlas_difumo(legacy_format=False, **kwargs)
 
 
+def get_resampled_atlas(
+    atlas_filename: str, target_filename: str, cache_dir: str
+) -> str:
+    """Return the atlas resampled onto the grid of a target image, resampling it only
+    if it is not already cached for this grid.
+
+    The cache is keyed by the atlas (hence its dimension), the target affine and the
+    target shape, which are read from the header of `target_filename` only.
+
+    Parameters
+    ----------
+    atlas_filename : str
+        Path to the (probabilistic) atlas file
+    target_filename : str
+        Path to an image defining the target grid (usually a BOLD file)
+    cache_dir : str
+        Path to the directory where resampled atlases are stored
+
+    Returns
+    -------
+    str
+        Path to the resampled atlas.
+    """
+    header = load_nifti_header(target_filename)
+    target_affine = header.get_best_affine()
+    target_shape = tuple(int(dim) for dim in header.get_data_shape()[:3])
+
+    key = hashlib.sha1(
+        f"{op.abspath(atlas_filename)}:{np.round(target_affine, 6).tolist()}:"
+        f"{target_shape}".encode()
+    ).hexdigest()[:16]
+    resampled_filename = op.join(cache_dir, f"maps_{key}.nii.gz")
+
+    if not op.exists(resampled_filename):
+        logging.info(f"Resampling the atlas onto a {target_shape} grid ...")
+        resampled = resample_img(
+            atlas_filename,
+            target_affine=target_affine,
+            target_shape=target_shape,
+            interpolation="continuous",
+        )
+
+        # Write atomically, as concurrent groups of files may resample the same atlas
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_filename = tempfile.mkstemp(suffix=".nii.gz", dir=cache_dir)
+        os.close(fd)
+        resampled.to_filename(tmp_filename)
+        os.replace(tmp_filename, resampled_filename)
+    else:
+        logging.debug(f"Reusing resampled atlas {resampled_filename}")
+
+    return resampled_filename
+
+
 def find_atlas_dimension(path: str, atlas_name: str = "DiFuMo") -> int:
     """Fetch the atlas dimension from the path where the functional connectivity are saved.
     Parameters
@@ -332,7 +848,7 @@ def reorder_iqms(iqms_df: pd.DataFrame, fc_paths: list[str]):
     iqms_df[["subject", "session", "task"]] = iqms_df["bids_name"].str.extract(
         r"sub-(\d+)_ses-(\d+)_task-(\w+)_"
     )
-    entities_list = [parse_file_entities(filepath) for filepath in fc_paths]
+    entities_list = [parse_entities(filepath) for filepath in fc_paths]
     entities_df = pd.DataFrame(entities_list)
 
     return pd.merge(
@@ -390,15 +906,155 @@ def load_iqms(
     return iqms_df
 
 
+def get_manifest_path(output: str) -> str:
+    """Return the path to the provenance manifest of an output directory."""
+    return op.join(output, MANIFEST_FILENAME)
+
+
+def hash_parameters(params: dict, **kwargs) -> str:
+    """Hash the parameters an output was computed with.
+
+    Parameters
+    ----------
+    params : dict
+        Parameters of the computation (atlas, denoising, estimator, ...)
+    **kwargs
+        Naming arguments of the output (patterns and entities), so that different
+        kinds of outputs computed with the same parameters are told apart
+
+    Returns
+    -------
+    str
+        SHA-1 of the JSON representation of the parameters.
+    """
+    serialized = json.dumps({**params, **kwargs}, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode()).hexdigest()
+
+
+def get_input_signature(filename: str) -> tuple[str, int, int]:
+    """Return the absolute path, size and modification time of an input file.
+
+    The size and modification time are -1 if the file does not exist.
+    """
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return op.abspath(filename), -1, -1
+    return op.abspath(filename), stat.st_size, stat.st_mtime_ns
+
+
+def connect_manifest(output: str) -> sqlite3.Connection:
+    """Open (and create if needed) the provenance manifest of an output directory.
+
+    Parameters
+    ----------
+    output : str
+        Path to the output directory
+
+    Returns
+    -------
+    sqlite3.Connection
+        Connection to the manifest.
+    """
+    os.makedirs(output, exist_ok=True)
+    connection = sqlite3.connect(get_manifest_path(output))
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS outputs (
+            output TEXT PRIMARY KEY,
+            input TEXT NOT NULL,
+            input_size INTEGER NOT NULL,
+            input_mtime_ns INTEGER NOT NULL,
+            params_hash TEXT NOT NULL,
+            params TEXT NOT NULL,
+            created REAL NOT NULL
+        )"""
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS outputs_params ON outputs (params_hash)"
+    )
+    return connection
+
+
+def record_outputs(
+    original_filenames: list[str], output: str, params: dict, **kwargs
+) -> None:
+    """Record in the provenance manifest the outputs computed from the input files.
+
+    Parameters
+    ----------
+    original_filenames : list[str]
+        List of input filenames
+    output : str
+        Path to the output directory
+    params : dict
+        Parameters of the computation (atlas, denoising, estimator, ...)
+    **kwargs
+        Naming arguments of the outputs (passed to `get_bids_savename`)
+    """
+    params_hash = hash_parameters(params, **kwargs)
+    serialized = json.dumps(params, sort_keys=True, default=str)
+    rows = [
+        (
+            get_bids_savename(filename, **kwargs),
+            *get_input_signature(filename),
+            params_hash,
+            serialized,
+            time.time(),
+        )
+        for filename in original_filenames
+    ]
+
+    connection = connect_manifest(output)
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+    connection.close()
+
+
+def query_manifest(output: str, params: dict, **kwargs) -> dict:
+    """Get the outputs recorded in the provenance manifest for given parameters.
+
+    Parameters
+    ----------
+    output : str
+        Path to the output directory
+    params : dict
+        Parameters of the computation (atlas, denoising, estimator, ...)
+    **kwargs
+        Naming arguments of the outputs (passed to `get_bids_savename`)
+
+    Returns
+    -------
+    dict
+        Paths (relative to `output`) of the recorded outputs, indexed by the
+        signature of their input file (see `get_input_signature`).
+    """
+    connection = connect_manifest(output)
+    rows = connection.execute(
+        "SELECT output, input, input_size, input_mtime_ns FROM outputs "
+        "WHERE params_hash = ?",
+        (hash_parameters(params, **kwargs),),
+    ).fetchall()
+    connection.close()
+    return {tuple(signature): path for path, *signature in rows}
+
+
 def check_existing_output(
     output: str,
     func_filename: list[str],
     return_existing: bool = False,
     return_output: bool = False,
+    params: Optional[dict] = None,
     **kwargs,
 ) -> tuple[list[str], list[str]]:
     """Check for existing output.
 
+    If `params` is given and the output directory has a provenance manifest, an
+    output is only considered existing if it was recorded for the same parameters
+    and the same (unmodified) input file. Otherwise, the existence of the output
+    files is checked.
+
     Parameters
     ----------
     output : str
@@ -410,6 +1066,8 @@ def check_existing_output(
         False
     return_output: bool, optional
         Condition to return the path of existing outputs, by default False
+    params : Optional[dict], optional
+        Parameters of the computation to look up in the manifest, by default None
 
     Returns
     -------
@@ -421,36 +1079,50 @@ def check_existing_output(
             "Setting return_output=True in check_existing_output requires return_existing=True."
         )
 
-    missing_data_filter = [
-        not op.exists(op.join(output, get_bids_savename(filename, **kwargs)))
-        for filename in func_filename
-    ]
+    # Path of the output of each input file, None if missing
+    if params is not None and op.exists(get_manifest_path(output)):
+        recorded = query_manifest(output, params, **kwargs)
+        output_paths = [
+            recorded.get(get_input_signature(filename)) for filename in func_filename
+        ]
+        # Outputs deleted since they were recorded are missing
+        output_paths = [
+            path if path is not None and output_exists(op.join(output, path)) else None
+            for path in output_paths
+        ]
+    else:
+        output_paths = []
+        for filename in func_filename:
+            path = get_bids_savename(filename, **kwargs)
+            output_paths.append(path if output_exists(op.join(output, path)) else None)
 
-    missing_data = np.array(func_filename)[missing_data_filter]
+    missing_data = [
+        filename for filename, path in zip(func_filename, output_paths) if path is None
+    ]
     logging.debug(
-        f"\t{sum(missing_data_filter)} missing data found for files:"
+        f"\t{len(missing_data)} missing data found for files:"
         "\n\t" + "\n\t".join(missing_data)
     )
 
     if return_existing:
         if return_output:
             existing_output = [
-                op.join(output, get_bids_savename(filename, **kwargs))
-                for filename in func_filename
-                if op.exists(op.join(output, get_bids_savename(filename, **kwargs)))
+                op.join(output, path) for path in output_paths if path is not None
             ]
             return existing_output
         else:
-            existing_data = np.array(func_filename)[
-                [not fltr for fltr in missing_data_filter]
+            existing_data = [
+                filename
+                for filename, path in zip(func_filename, output_paths)
+                if path is not None
             ]
-            return missing_data.tolist(), existing_data.tolist()
+            return missing_data, existing_data
 
-    return missing_data.tolist()
+    return missing_data
 
 
 def load_timeseries(func_filename: list[str], output: str) -> list[np.ndarray]:
-    """Load existing timeseries from .csv files.
+    """Load existing timeseries from .tsv files (or their binary sidecars).
 
     Parameters
     ----------
@@ -473,20 +1145,173 @@ def load_timeseries(func_filename: list[str], output: str) -> list[np.ndarray]:
             filename, patterns=TIMESERIES_PATTERN, **TIMESERIES_FILLS
         )
         logging.debug(f"\t{op.join(output, path_to_ts)}")
-        loaded_ts.append(
-            np.genfromtxt(op.join(output, path_to_ts), float, delimiter="\t")
-        )
+        loaded_ts.append(load_array(op.join(output, path_to_ts)))
 
     return loaded_ts
 
 
-def get_confounds_manually(func_filename: list[str], **kwargs) -> tuple[list, list]:
-    """Manually load the fMRIPrep confounds.
+def get_confounds_filename(func_filename: str) -> str:
+    """Return the path to the fMRIPrep confounds file of a functional file.
+
+    Parameters
+    ----------
+    func_filename : str
+        BIDS functional filename
+
+    Returns
+    -------
+    str
+        Path to the confounds file (TSV).
+    """
+    confounds_file = op.join(
+        op.dirname(func_filename),
+        get_bids_savename(func_filename, patterns=CONFOUND_PATTERN, **CONFOUND_FILLS),
+    )
+    if op.exists(confounds_file):
+        return confounds_file
+    # Fall back to the naming conventions known by nilearn (e.g., older fMRIPrep)
+    return _get_file_name(func_filename)
+
+
+def read_confound_columns(
+    confounds_file: str, keywords: tuple, cache_dir: Optional[str] = None
+) -> pd.DataFrame:
+    """Read the columns of a confounds file whose name contains one of the keywords.
+
+    Only the selected columns are parsed. If a cache directory is given, the parsed
+    columns are stored as a binary .npz file, keyed by the path, size and
+    modification time of the confounds file and by the keywords.
+
+    Parameters
+    ----------
+    confounds_file : str
+        Path to the fMRIPrep confounds file (TSV)
+    keywords : tuple
+        Substrings of the names of the columns to read
+    cache_dir : Optional[str], optional
+        Path to the cache directory, by default None (no caching)
+
+    Returns
+    -------
+    pd.DataFrame
+        Selected confounds, in the order of the file.
+    """
+    cache_path = None
+    if cache_dir is not None:
+        stat = os.stat(confounds_file)
+        key = hashlib.sha1(
+            f"{op.abspath(confounds_file)}:{stat.st_size}:{stat.st_mtime_ns}:"
+            f"{','.join(sorted(keywords))}".encode()
+        ).hexdigest()[:16]
+        name = op.basename(confounds_file).split(".")[0]
+        cache_path = op.join(cache_dir, CONFOUNDS_CACHE_DIRNAME, f"{name}_{key}.npz")
+        if op.exists(cache_path):
+            with np.load(cache_path) as cached:
+                return pd.DataFrame(cached["values"], columns=cached["columns"])
+
+    confounds = read_csv(
+        confounds_file,
+        delimiter="\t",
+        encoding="utf-8",
+        usecols=lambda column: any(keyword in column for keyword in keywords),
+        dtype=float,
+    )
+
+    if cache_path is not None:
+        # Write atomically, as several threads may cache the same file
+        os.makedirs(op.dirname(cache_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".npz", dir=op.dirname(cache_path))
+        os.close(fd)
+        np.savez(
+            tmp_path,
+            values=confounds.to_numpy(),
+            columns=np.array(confounds.columns, dtype=str),
+        )
+        os.replace(tmp_path, cache_path)
+    return confounds
+
+
+def load_single_confounds(
+    func_filename: str, cache_dir: Optional[str] = None, **kwargs
+) -> tuple[Optional[np.ndarray], pd.DataFrame]:
+    """Load the confounds of a functional file, as nilearn's load_confounds would.
+
+    Parameters
+    ----------
+    func_filename : str
+        BIDS functional filename
+    cache_dir : Optional[str], optional
+        Path to the cache directory of the parsed confounds, by default None
+
+    Returns
+    -------
+    tuple[Optional[np.ndarray], pd.DataFrame]
+        The sample mask (None if no volume is censored) and the confounds.
+
+    Raises
+    ------
+    ValueError
+        If the strategy contains an unknown component.
+    """
+    params = {**LOAD_CONFOUNDS_DEFAULTS, **kwargs}
+    strategy = params.pop("strategy")
+    demean = params.pop("demean")
+
+    components = [name for name in CONFOUND_KEYWORDS if name != "non_steady_state"]
+    unknown = [component for component in strategy if component not in components]
+    if unknown:
+        raise ValueError(
+            f"Unknown denoising component(s) {unknown} in the strategy, must be "
+            f"among {components}."
+        )
+
+    keywords = tuple(
+        chain.from_iterable(
+            CONFOUND_KEYWORDS[component]
+            for component in ("non_steady_state", *strategy)
+        )
+    )
+    confounds_file = get_confounds_filename(func_filename)
+    confounds_all = read_confound_columns(confounds_file, keywords, cache_dir)
+
+    flag_acompcor = "compcor" in strategy and "anat" in params["compcor"]
+    meta_json = _load_confounds_json(
+        confounds_file.replace("tsv", "json"), flag_acompcor=flag_acompcor
+    )
+
+    # Same selection as nilearn, on the parsed columns only
+    missing = {"confounds": [], "keywords": []}
+    confounds_select = []
+    for component in ("non_steady_state", *strategy):
+        loaded_confounds, missing = _load_noise_component(
+            confounds_all, component, missing, meta_json=meta_json, **params
+        )
+        confounds_select.append(loaded_confounds)
+    _check_error(missing)
+
+    return _prepare_output(pd.concat(confounds_select, axis=1), demean)
+
+
+def load_confounds_parallel(
+    func_filename: list[str],
+    cache_dir: Optional[str] = None,
+    n_threads: int = N_CONFOUNDS_THREADS,
+    **kwargs,
+) -> tuple[list, list]:
+    """Load the fMRIPrep confounds of several functional files concurrently.
+
+    Only the columns required by the denoising strategy are parsed (see
+    `read_confound_columns`). The keyword arguments are those of nilearn's
+    load_confounds.
 
     Parameters
     ----------
     func_filename : list[str]
         List of BIDS functional filenames
+    cache_dir : Optional[str], optional
+        Path to the cache directory of the parsed confounds, by default None
+    n_threads : int, optional
+        Number of threads reading the files, by default N_CONFOUNDS_THREADS
 
     Returns
     -------
@@ -494,25 +1319,16 @@ def get_confounds_manually(func_filename: list[str], **kwargs) -> tuple[list, li
         Two lists, one with the loaded confounds (for each input file) and one with the
         corresponding sample mask.
     """
-    confounds, sample_mask = [], []
-
-    for filename in func_filename:
-        dir_name = op.dirname(filename)
-        confounds_file = op.join(
-            dir_name,
-            get_bids_savename(filename, patterns=CONFOUND_PATTERN, **CONFOUND_FILLS),
-        )
-
-        # confounds_json_file = load_confounds._get_json(confounds_file)
-        confounds_json_file = confounds_file.replace("tsv", "json")
-        individual_sm, individual_conf = _load_single_confounds_file(
-            confounds_file=confounds_file,
-            confounds_json_file=confounds_json_file,
-            **kwargs,
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        loaded = list(
+            executor.map(
+                lambda filename: load_single_confounds(filename, cache_dir, **kwargs),
+                func_filename,
+            )
         )
-        confounds.append(individual_conf)
-        sample_mask.append(individual_sm)
 
+    sample_mask = [individual_sm for individual_sm, _ in loaded]
+    confounds = [individual_conf for _, individual_conf in loaded]
     return confounds, sample_mask
 
 
@@ -520,6 +1336,8 @@ def save_output(
     data_list: list[np.ndarray],
     original_filenames: list[str],
     output: str,
+    output_format: str = "tsv",
+    params: Optional[dict] = None,
     **kwargs,
 ) -> None:
     """Save the output files.
@@ -532,10 +1350,360 @@ def save_output(
         List of original filenames
     output : Optional[str], optional
         Path to the output directory, by default None
+    output_format : str, optional
+        Save as "tsv", as binary .npy sidecar ("npy") or "both", by default "tsv"
+    params : Optional[dict], optional
+        Parameters of the computation, recorded in the provenance manifest, by
+        default None (not recorded)
     """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unknown output format '{output_format}', must be one of {OUTPUT_FORMATS}."
+        )
+
     for data, filename in zip(data_list, original_filenames):
         path_to_save = get_bids_savename(filename, **kwargs)
         saveloc = op.join(output, path_to_save)
         logging.debug(f"Saving data of type {type(data)} to: {saveloc}")
         os.makedirs(op.dirname(saveloc), exist_ok=True)
-        np.savetxt(saveloc, data, delimiter="\t")
+        if output_format in ("tsv", "both"):
+            np.savetxt(saveloc, data, delimiter="\t")
+        if output_format in ("npy", "both"):
+            np.save(get_binary_sidecar(saveloc), np.asarray(data))
+        elif op.exists(get_binary_sidecar(saveloc)):
+            # A sidecar left by a previous run would shadow the new TSV file
+            os.remove(get_binary_sidecar(saveloc))
+
+    if params is not None:
+        record_outputs(original_filenames, output, params, **kwargs)
+
+
+def get_group_store_path(output: str, meas: str) -> str:
+    """Return the path to the group-level store of connectivity matrices.
+
+    Parameters
+    ----------
+    output : str
+        Path to the output directory
+    meas : str
+        Label of the connectivity measure (e.g. "correlation")
+
+    Returns
+    -------
+    str
+        Path to the HDF5 group store.
+    """
+    return op.join(output, GROUP_STORE_FILENAME.format(meas=meas))
+
+
+def append_group_store(
+    fc_matrices: list[np.ndarray],
+    original_filenames: list[str],
+    output: str,
+    meas: str,
+) -> str:
+    """Append connectivity matrices to the group-level HDF5 store.
+
+    Only the upper triangle (without diagonal) of each matrix is stored, as one row of
+    the "edges" dataset. The "filename" dataset holds the path of the corresponding
+    connectivity file relative to `output`, and the "index" group holds one dataset
+    per BIDS entity. Sessions already present in the store are overwritten.
+
+    Parameters
+    ----------
+    fc_matrices : list[np.ndarray]
+        List of functional connectivity matrices
+    original_filenames : list[str]
+        List of original filenames
+    output : str
+        Path to the output directory
+    meas : str
+        Label of the connectivity measure (e.g. "correlation")
+
+    Returns
+    -------
+    str
+        Path to the HDF5 group store.
+    """
+    store_path = get_group_store_path(output, meas)
+    if not len(fc_matrices):
+        return store_path
+
+    n_rois = fc_matrices[0].shape[0]
+    upper_triangle_indices = np.triu_indices(n_rois, k=1)
+    n_edges = len(upper_triangle_indices[0])
+    string_dtype = h5py.string_dtype()
+
+    logging.debug(f"Appending {len(fc_matrices)} matrices to {store_path}")
+    with h5py.File(store_path, "a") as h5f:
+        if "edges" not in h5f:
+            h5f.attrs["n_rois"] = n_rois
+            h5f.attrs["meas"] = meas
+            h5f.create_dataset(
+                "edges",
+                shape=(0, n_edges),
+                maxshape=(None, n_edges),
+                chunks=(1, n_edges),
+                dtype="f8",
+            )
+            for name in ("filename",) + tuple(
+                f"index/{entity}" for entity in GROUP_STORE_ENTITIES
+            ):
+                h5f.create_dataset(
+                    name, shape=(0,), maxshape=(None,), dtype=string_dtype
+                )
+        elif h5f.attrs["n_rois"] != n_rois:
+            raise ValueError(
+                f"The group store {store_path} holds matrices with "
+                f"{h5f.attrs['n_rois']} regions, cannot append matrices with {n_rois}."
+            )
+
+        rows = {name: i for i, name in enumerate(h5f["filename"].asstr()[()])}
+        for matrix, filename in zip(fc_matrices, original_filenames):
+            fc_path = get_bids_savename(
+                filename, patterns=FC_PATTERN, meas=meas, **FC_FILLS
+            )
+            if fc_path not in rows:
+                rows[fc_path] = h5f["edges"].shape[0]
+                entities = parse_entities(filename)
+                for name, value in [("filename", fc_path)] + [
+                    (f"index/{entity}", str(entities.get(entity, "")))
+                    for entity in GROUP_STORE_ENTITIES
+                ]:
+                    h5f[name].resize((rows[fc_path] + 1,))
+                    h5f[name][rows[fc_path]] = value
+                h5f["edges"].resize((rows[fc_path] + 1, n_edges))
+
+            h5f["edges"][rows[fc_path]] = np.asarray(matrix)[upper_triangle_indices]
+
+    return store_path
+
+
+def load_group_store(
+    store_path: str, fc_paths: Optional[list[str]] = None
+) -> tuple[np.ndarray, pd.DataFrame]:
+    """Load the connectivity matrices from the group-level HDF5 store in one read.
+
+    Parameters
+    ----------
+    store_path : str
+        Path to the HDF5 group store
+    fc_paths : Optional[list[str]], optional
+        Paths of the connectivity files (relative to the output directory) to load,
+        in the order they should be returned, by default all the stored sessions
+
+    Returns
+    -------
+    tuple[np.ndarray, pd.DataFrame]
+        Array of shape (n_sessions, n_edges) with the upper triangle of each
+        matrix, and the entity index of the corresponding sessions.
+    """
+    with h5py.File(store_path, "r") as h5f:
+        index = pd.DataFrame(
+            {
+                entity: h5f[f"index/{entity}"].asstr()[()]
+                for entity in GROUP_STORE_ENTITIES
+            }
+        )
+        index.insert(0, "filename", h5f["filename"].asstr()[()])
+        edges = h5f["edges"][()]
+
+    if fc_paths is not None:
+        rows = pd.Series(index.index, index=index["filename"])
+        missing = set(fc_paths) - set(rows.index)
+        if missing:
+            raise ValueError(
+                f"{len(missing)} connectivity matrices are missing from the group "
+                f"store {store_path}."
+            )
+        selection = rows.loc[fc_paths].to_numpy()
+        edges = edges[selection]
+        index = index.iloc[selection].reset_index(drop=True)
+
+    return edges, index
+
+
+def load_fc_edges(fc_filenames: list[str], output: str, meas: str) -> np.ndarray:
+    """Load the upper triangles of connectivity matrices, from the group store if it
+    holds all of them and from the individual files otherwise.
+
+    Both sources give the same array, so the group report does not depend on which
+    one was read.
+
+    Parameters
+    ----------
+    fc_filenames : list[str]
+        Paths to the connectivity files (TSV)
+    output : str
+        Path to the output directory
+    meas : str
+        Type of connectivity measure
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n_sessions, n_edges) with the upper triangle (without the
+        diagonal) of each matrix, in the order of `fc_filenames`.
+    """
+    store_path = get_group_store_path(output, meas)
+    if op.exists(store_path):
+        try:
+            fc_paths = [op.relpath(file_path, output) for file_path in fc_filenames]
+            edges, _ = load_group_store(store_path, fc_paths)
+            logging.info(f"Loaded {len(fc_filenames)} matrices from {store_path}")
+            return edges
+        except ValueError as msg:
+            logging.warning(f"{msg} Loading the individual files instead.")
+
+    edges = None
+    for i, file_path in enumerate(fc_filenames):
+        # Memory-mapped if saved as binary
+        fc_matrix = load_array(file_path)
+        if edges is None:
+            upper_triangle_indices = np.triu_indices(fc_matrix.shape[0], k=1)
+            edges = np.empty((len(fc_filenames), len(upper_triangle_indices[0])))
+        edges[i] = fc_matrix[upper_triangle_indices]
+    return edges
+
+
+def get_connectivity_state_path(output: str, meas: str) -> str:
+    """Get the path to the state file of the incremental connectivity estimation.
+
+    Parameters
+    ----------
+    output : str
+        Path to the output directory
+    meas : str
+        Label of the connectivity measure
+
+    Returns
+    -------
+    str
+        Path to the state file.
+    """
+    return op.join(output, CONNECTIVITY_STATE_FILENAME.format(meas=meas))
+
+
+def load_connectivity_state(output: str, meas: str) -> dict:
+    """Load the state of the incremental connectivity estimation.
+
+    The state records the sessions whose connectivity was estimated ("sessions"),
+    the group-level terms of the estimation ("group": the shared alpha, the file of
+    the group-average covariance and the sessions they were estimated on) and the
+    group-level terms that must be refreshed ("stale").
+
+    Parameters
+    ----------
+    output : str
+        Path to the output directory
+    meas : str
+        Label of the connectivity measure
+
+    Returns
+    -------
+    dict
+        The state, empty if no state file exists.
+    """
+    state_path = get_connectivity_state_path(output, meas)
+    if not op.exists(state_path):
+        return {"sessions": [], "group": {}, "stale": []}
+
+    with open(state_path) as f:
+        return json.load(f)
+
+
+def update_connectivity_state(
+    state: dict, sessions: list[str], group: Optional[dict] = None
+) -> dict:
+    """Record newly estimated sessions and flag the group-level terms to refresh.
+
+    The group report is stale as soon as sessions are added, and the group estimate
+    (shared alpha and group-average covariance) is stale while some sessions were
+    not part of the data it was estimated on.
+
+    Parameters
+    ----------
+    state : dict
+        Current state (see `load_connectivity_state`)
+    sessions : list[str]
+        Names of the newly estimated sessions
+    group : Optional[dict], optional
+        Newly estimated group-level terms, by default None (unchanged)
+
+    Returns
+    -------
+    dict
+        The updated state.
+    """
+    all_sessions = set(state["sessions"]) | set(sessions)
+    group = state["group"] if group is None else group
+    stale = set(state["stale"])
+
+    if sessions:
+        stale.add("group_report")
+
+    if group and all_sessions - set(group["sessions"]):
+        stale.add("group_estimate")
+    else:
+        stale.discard("group_estimate")
+
+    return {"sessions": sorted(all_sessions), "group": group, "stale": sorted(stale)}
+
+
+def save_connectivity_state(
+    state: dict,
+    output: str,
+    meas: str,
+    group_covariance: Optional[np.ndarray] = None,
+) -> str:
+    """Save the state of the incremental connectivity estimation.
+
+    Parameters
+    ----------
+    state : dict
+        State to save (see `load_connectivity_state`)
+    output : str
+        Path to the output directory
+    meas : str
+        Label of the connectivity measure
+    group_covariance : Optional[np.ndarray], optional
+        Group-average covariance to save along the state, by default None
+
+    Returns
+    -------
+    str
+        Path to the state file.
+    """
+    if group_covariance is not None:
+        covariance_filename = GROUP_COVARIANCE_FILENAME.format(meas=meas)
+        np.save(op.join(output, covariance_filename), group_covariance)
+        state["group"]["covariance"] = covariance_filename
+
+    state_path = get_connectivity_state_path(output, meas)
+    with open(f"{state_path}.tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{state_path}.tmp", state_path)
+    return state_path
+
+
+def load_group_estimate(
+    state: dict, output: str
+) -> Optional[tuple[float, np.ndarray]]:
+    """Load the shared alpha and the group-average covariance recorded in a state.
+
+    Parameters
+    ----------
+    state : dict
+        State of the incremental connectivity estimation
+    output : str
+        Path to the output directory
+
+    Returns
+    -------
+    Optional[tuple[float, np.ndarray]]
+        The alpha and the group-average covariance, None if there are none.
+    """
+    if not state["group"]:
+        return None
+    covariance = np.load(op.join(output, state["group"]["covariance"]))
+    return state["group"]["alpha"], covariance
@@ -58,13 +58,22 @@
 #   DAMAGE.
 """Transformer for computing ROI signals of multiple 4D images."""
 
+import hashlib
 import itertools
+import os
+import os.path as op
+from functools import lru_cache
 
+import nibabel as nb
+import numpy as np
 from joblib import Memory, Parallel, delayed
+from nibabel.openers import ImageOpener
 
 from nilearn._utils.niimg_conversions import _iter_check_niimg
 from nilearn.maskers.nifti_maps_masker import NiftiMapsMasker
 
+DEFAULT_CHUNK_SIZE = 100
+
 
 class MultiNiftiMapsMasker(NiftiMapsMasker):
     """Class for masking of Niimg-like objects.
@@ -270,3 +279,235 @@ class MultiNiftiMapsMasker(NiftiMapsMasker):
         return self.transform_imgs(
             imgs, confounds, n_jobs=self.n_jobs, sample_mask=sample_mask
         )
+
+
+def compute_maps_projector(maps_img):
+    """Compute the least-squares projector of a set of maps.
+
+    The signals extracted by :class:`nilearn.maskers.NiftiMapsMasker` are the
+    least-squares solution of ``maps @ signals.T = data`` restricted to the voxels
+    covered by at least one map. As the maps do not change, the pseudo-inverse of
+    the masked maps can be computed once and applied to every image.
+
+    Parameters
+    ----------
+    maps_img : 4D niimg-like object
+        Set of continuous maps.
+
+    Returns
+    -------
+    voxels : 1D :obj:`numpy.ndarray`
+        Flat (C-ordered) indices of the voxels covered by the maps.
+    projector : 2D :obj:`numpy.ndarray`
+        Pseudo-inverse of the masked maps, shape: (number of maps, number of voxels)
+
+    """
+    maps_img = nb.load(maps_img) if isinstance(maps_img, str) else maps_img
+    maps = np.asarray(maps_img.dataobj, dtype=np.float64)
+    maps = maps.reshape(-1, maps.shape[-1])
+    voxels = np.flatnonzero(np.any(maps != 0, axis=1))
+    return voxels, np.linalg.pinv(maps[voxels])
+
+
+@lru_cache(maxsize=4)
+def _load_maps_projector(maps_filename, mtime_ns, cache_dir=None):
+    """Load the projector of a maps file, computing and storing it if needed."""
+    if cache_dir is None:
+        return compute_maps_projector(maps_filename)
+
+    key = hashlib.sha1(f"{maps_filename}:{mtime_ns}".encode()).hexdigest()[:16]
+    projector_file = op.join(cache_dir, f"projector_{key}.npz")
+    if op.exists(projector_file):
+        with np.load(projector_file) as cached:
+            return cached["voxels"], cached["projector"]
+
+    voxels, projector = compute_maps_projector(maps_filename)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = f"{projector_file[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_file, voxels=voxels, projector=projector)
+    os.replace(tmp_file, projector_file)
+    return voxels, projector
+
+
+def iter_volume_blocks(img, voxels, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Iterate over the volumes of a 4D image, by blocks of consecutive volumes.
+
+    Images stored in a file (e.g., ``.nii.gz`` from fMRIPrep) are read in a single
+    sequential pass through one file handle: slicing the array proxy instead would
+    decompress a gzipped file again from its beginning for every block.
+
+    Parameters
+    ----------
+    img : :obj:`nibabel.nifti1.Nifti1Image`
+        4D image.
+    voxels : 1D :obj:`numpy.ndarray`
+        Flat (C-ordered) indices of the voxels to read.
+    chunk_size : :obj:`int`, optional
+        Number of volumes per block. Default=100.
+
+    Yields
+    ------
+    start : :obj:`int`
+        Index of the first volume of the block.
+    block : 2D :obj:`numpy.ndarray`
+        Scaled values of the voxels in the block, as float64,
+        shape: (number of voxels, number of volumes).
+
+    """
+    shape = img.shape[:3]
+    n_scans = img.shape[3]
+    n_voxels = int(np.prod(shape))
+    # Volumes are Fortran-ordered on disk
+    voxels = np.ravel_multi_index(np.unravel_index(voxels, shape), shape, order="F")
+
+    proxy = img.dataobj
+    if not (
+        nb.is_proxy(proxy)
+        and isinstance(proxy.file_like, (str, os.PathLike))
+        and proxy.order == "F"
+    ):
+        # In-memory images, nibabel scales the data
+        for start in range(0, n_scans, chunk_size):
+            stop = min(start + chunk_size, n_scans)
+            block = np.asarray(proxy[..., start:stop])
+            block = block.reshape(n_voxels, stop - start, order="F")
+            yield start, block[voxels].astype(np.float64)
+        return
+
+    # Voxels are selected before upcasting and scaling, so that no float64 volume is
+    # allocated
+    dtype = np.dtype(proxy.dtype)
+    slope, inter = proxy.slope, proxy.inter
+    with ImageOpener(proxy.file_like) as fileobj:
+        fileobj.seek(proxy.offset)
+        for start in range(0, n_scans, chunk_size):
+            stop = min(start + chunk_size, n_scans)
+            buffer = fileobj.read(n_voxels * (stop - start) * dtype.itemsize)
+            block = np.frombuffer(buffer, dtype=dtype)
+            block = block.reshape(n_voxels, stop - start, order="F")
+            block = block[voxels].astype(np.float64)
+            if slope != 1.0 or inter != 0.0:
+                block = block * slope + inter
+            yield start, block
+
+
+class MapsProjector:
+    """Extract one time course per map with a precomputed least-squares projector.
+
+    This is a fast equivalent of the extraction step of
+    :class:`nilearn.maskers.NiftiMapsMasker` (without mask, smoothing nor
+    denoising): the pseudo-inverse of the maps is computed once per maps file
+    (and optionally stored on disk), and each 4D image is read sequentially in
+    chunks of volumes (see :func:`iter_volume_blocks`) that are projected with a
+    single matrix product.
+
+    .. note::
+        Inf or NaN present in the given input images are put to zero, as nilearn
+        does.
+
+    Parameters
+    ----------
+    maps_img : :obj:`str`
+        Path to the set of continuous maps, on the grid of the images to process
+        (see ``load_save.get_resampled_atlas``).
+    chunk_size : :obj:`int`, optional
+        Number of volumes read and projected at once. Default=100.
+    cache_dir : :obj:`str`, optional
+        Directory where the projector is stored, to be shared across processes.
+        Default=None (the projector is only cached in memory).
+    n_jobs : :obj:`int`, optional
+        Number of images processed concurrently (threads). Default=1.
+
+    Attributes
+    ----------
+    voxels_ : 1D :obj:`numpy.ndarray`
+        Flat indices of the voxels covered by the maps.
+    projector_ : 2D :obj:`numpy.ndarray`
+        Pseudo-inverse of the masked maps.
+
+    """
+
+    def __init__(
+        self, maps_img, chunk_size=DEFAULT_CHUNK_SIZE, cache_dir=None, n_jobs=1
+    ):
+        self.maps_img = maps_img
+        self.chunk_size = chunk_size
+        self.cache_dir = cache_dir
+        self.n_jobs = n_jobs
+
+    def fit(self, imgs=None, y=None):
+        """Load (or compute) the projector of the maps.
+
+        Parameters
+        ----------
+        imgs : None
+            Ignored, present for API consistency.
+        y : None
+            Ignored, present for API consistency.
+
+        """
+        maps_filename = op.abspath(self.maps_img)
+        maps_img = nb.load(maps_filename)
+        self.maps_shape_ = maps_img.shape[:3]
+        self.maps_affine_ = maps_img.affine
+        self.voxels_, self.projector_ = _load_maps_projector(
+            maps_filename, os.stat(maps_filename).st_mtime_ns, self.cache_dir
+        )
+        return self
+
+    def transform_single_imgs(self, imgs):
+        """Extract signals from a single 4D niimg.
+
+        Parameters
+        ----------
+        imgs : :obj:`str` or :obj:`nibabel.nifti1.Nifti1Image`
+            Image to process, on the grid of the maps.
+
+        Returns
+        -------
+        region_signals : 2D :obj:`numpy.ndarray`
+            Signal for each map.
+            shape: (number of scans, number of maps)
+
+        """
+        img = nb.load(imgs) if isinstance(imgs, (str, os.PathLike)) else imgs
+        if img.shape[:3] != self.maps_shape_ or not np.allclose(
+            img.affine, self.maps_affine_
+        ):
+            raise ValueError(
+                "The maps and the images must share the same grid, resample the maps"
+                " onto the grid of the images first."
+            )
+
+        if len(img.shape) != 4:
+            raise ValueError(f"Expected a 4D image, got shape {img.shape}.")
+
+        n_scans = img.shape[3]
+        region_signals = np.empty((n_scans, self.projector_.shape[0]))
+        for start, chunk in iter_volume_blocks(img, self.voxels_, self.chunk_size):
+            chunk = np.nan_to_num(chunk, nan=0.0, posinf=0.0, neginf=0.0)
+            region_signals[start : start + chunk.shape[1]] = chunk.T @ self.projector_.T
+        return region_signals
+
+    def transform(self, imgs):
+        """Extract signals from a list of 4D niimgs.
+
+        Parameters
+        ----------
+        imgs : :obj:`list` of 4D niimgs
+            Images to process.
+
+        Returns
+        -------
+        region_signals : list of 2D :obj:`numpy.ndarray`
+            List of signals for each map per image.
+            shape: list of (number of scans, number of maps)
+
+        """
+        return Parallel(n_jobs=self.n_jobs, prefer="threads")(
+            delayed(self.transform_single_imgs)(img) for img in imgs
+        )
+
+    def fit_transform(self, imgs, y=None):
+        """Load the projector and extract signals from a list of 4D niimgs."""
+        return self.fit().transform(imgs)
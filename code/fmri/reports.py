@@ -22,47 +22,60 @@
 #
 """Python module for functional connectivity visual reports"""
 
+import json
 import logging
 import os
 import os.path as op
+import shutil
+from threading import Lock
 from typing import Optional, Union
 
+import matplotlib
 import matplotlib.pyplot as plt
 import nibabel as nib
 import numpy as np
 import pandas as pd
 import plotly.offline as pyo
 import seaborn as sns
+from joblib import Parallel, delayed
 from matplotlib.axes import Axes
 from matplotlib.cm import get_cmap
+from matplotlib.collections import LineCollection
 from matplotlib.lines import Line2D
 from nireports.assembler.report import Report
 from nilearn.plotting import plot_design_matrix, plot_matrix
+from scipy.ndimage import gaussian_filter1d
 from scipy.stats import pearsonr, ks_2samp
 from time import strftime
 from uuid import uuid4
 
-from load_save import get_bids_savename
+from load_save import (
+    get_bids_savename,
+    get_binary_sidecar,
+    load_array,
+    FIGURE_FILLS,
+    FIGURE_PATTERN,
+)
 
 
-FIGURE_PATTERN: list = [
-    "sub-{subject}/figures/sub-{subject}[_ses-{session}]"
-    "[_task-{task}][_meas-{meas}][_desc-{desc}]"
-    "_{suffix}{extension}",
-    "sub-{subject}/figures/sub-{subject}[_ses-{session}]"
-    "[_task-{task}][_desc-{desc}]_{suffix}{extension}",
-]
-FIGURE_FILLS: dict = {"extension": "png"}
-
 TS_FIGURE_SIZE: tuple = (50, 25)
 FC_FIGURE_SIZE: tuple = (70, 45)
 LABELSIZE: int = 42
 NETWORK_CMAP: str = "turbo"
 N_PERMUTATION: int = 10000
+PERMUTATION_SEED: int = 42
+QC_FC_CHUNK_SIZE: int = 1024
+QC_FC_N_BINS: int = 2000
 ALPHA = 0.05
 PERCENT_MATCH_CUT_OFF = 95
 DURATION_CUT_OFF = 300
 
+REPORT_MODES: tuple = ("inline", "deferred", "none")
+REPORT_QUEUE_FILENAME: str = "report_queue.jsonl"
+REPORT_QUEUE_DIRNAME: str = "report_queue"
+# Groups of files with similar FoV and TR may queue reports concurrently
+REPORT_QUEUE_LOCK = Lock()
+
 
 def plot_timeseries_carpet(
     timeseries: np.ndarray,
@@ -162,6 +175,9 @@ def plot_timeseries_signal(
     color: str = "tab:blue",
     linewidth: float = 4,
     ax: Optional[Axes] = None,
+    fast: bool = False,
+    decimate: int = 1,
+    rasterized: bool = False,
 ) -> Axes:
     """Plot the timeseries as a signal plot.
 
@@ -183,6 +199,13 @@ def plot_timeseries_signal(
         Linewidth of the line plots, by default 4
     ax : Optional[Axes], optional
         Axes to draw on, by default None
+    fast : bool, optional
+        Draw all the signals as a single LineCollection instead of one line per
+        ROI, by default False
+    decimate : int, optional
+        Only plot one timepoint out of `decimate`, by default 1 (all timepoints)
+    rasterized : bool, optional
+        Rasterize the signals (in vector outputs such as SVG), by default False
 
     Returns
     -------
@@ -232,9 +255,26 @@ def plot_timeseries_signal(
             fontsize=LABELSIZE,
         )
 
-    x_plot = np.arange(n_timepoints)
-    for i, (roi_signal, col) in enumerate(zip(timeseries.T[sorting_index], colors)):
-        ax.plot(x_plot, i * vert_scale + roi_signal, color=col, linewidth=linewidth)
+    x_plot = np.arange(n_timepoints)[::decimate]
+    signals = timeseries[::decimate].T[sorting_index]
+    if fast:
+        # One artist whatever the number of ROIs, each signal offset vertically
+        offsets = np.arange(n_area)[:, np.newaxis] * vert_scale
+        segments = np.stack(np.broadcast_arrays(x_plot, signals + offsets), axis=-1)
+        lines = LineCollection(
+            segments, colors=colors, linewidths=linewidth, rasterized=rasterized
+        )
+        ax.add_collection(lines)
+        ax.autoscale_view()
+    else:
+        for i, (roi_signal, col) in enumerate(zip(signals, colors)):
+            ax.plot(
+                x_plot,
+                i * vert_scale + roi_signal,
+                color=col,
+                linewidth=linewidth,
+                rasterized=rasterized,
+            )
 
     ax.set_yticks(np.arange(n_area) * vert_scale)
     ax.set_yticklabels(labels, fontsize=LABELSIZE)
@@ -246,8 +286,52 @@ def plot_timeseries_signal(
     return ax
 
 
+def get_figure_path(filename: str, output: str, desc: str, **kwargs) -> str:
+    """Return the path of a per-session figure.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the corresponding BIDS functional file
+    output : str
+        Path to the output directory
+    desc : str
+        Description entity of the figure (e.g. "carpetplot" or "heatmap")
+
+    Returns
+    -------
+    str
+        Path to the figure.
+    """
+    return op.join(
+        output,
+        get_bids_savename(
+            filename, patterns=FIGURE_PATTERN, desc=desc, **FIGURE_FILLS, **kwargs
+        ),
+    )
+
+
+def save_figure(figure_path: str) -> None:
+    """Save the current figure and close it.
+
+    Parameters
+    ----------
+    figure_path : str
+        Path to the figure
+    """
+    logging.debug(f"Saving visual report at:\n\t{figure_path}")
+    os.makedirs(op.dirname(figure_path), exist_ok=True)
+    plt.savefig(figure_path)
+    plt.close()
+
+
 def plot_interpolation(
-    ts: np.ndarray, interpolated_ts: np.ndarray, filename: str, output: str
+    ts: np.ndarray,
+    interpolated_ts: np.ndarray,
+    filename: str,
+    output: str,
+    fast: bool = False,
+    decimate: int = 1,
 ) -> None:
     """Plot the interpolated timeseries overlaid with the timeseries before
     interpolation.
@@ -262,9 +346,16 @@ def plot_interpolation(
         Name of the corresponding BIDS functional file
     output : str
         Path to the output directory
+    fast : bool, optional
+        Draw the signals as rasterized LineCollections, by default False
+    decimate : int, optional
+        Only plot one timepoint out of `decimate`, by default 1 (all timepoints)
     """
-    ax = plot_timeseries_signal(ts)
-    ax = plot_timeseries_signal(interpolated_ts, color="tab:red", ax=ax, linewidth=2)
+    fast_kwargs = {"fast": fast, "decimate": decimate, "rasterized": fast}
+    ax = plot_timeseries_signal(ts, **fast_kwargs)
+    ax = plot_timeseries_signal(
+        interpolated_ts, color="tab:red", ax=ax, linewidth=2, **fast_kwargs
+    )
 
     legend_elements = [
         Line2D([0], [0], color=col, label=lab)
@@ -279,18 +370,7 @@ def plot_interpolation(
         fontsize=LABELSIZE,
     )
 
-    interpolate_saveloc = get_bids_savename(
-        filename,
-        patterns=FIGURE_PATTERN,
-        desc="interpolatedtimeseries",
-        **FIGURE_FILLS,
-    )
-
-    logging.debug("Saving interpolated timeseries visual report at:")
-    logging.debug(f"\t{op.join(output, interpolate_saveloc)}")
-    os.makedirs(op.join(output, op.dirname(interpolate_saveloc)), exist_ok=True)
-    plt.savefig(op.join(output, interpolate_saveloc))
-    plt.close()
+    save_figure(get_figure_path(filename, output, "interpolatedtimeseries"))
 
 
 def visual_report_timeserie(
@@ -317,30 +397,15 @@ def visual_report_timeserie(
     for plot_func, plot_desc in zip(
         [plot_timeseries_carpet, plot_timeseries_signal], ["carpetplot", "timeseries"]
     ):
-        ts_saveloc = get_bids_savename(
-            filename, patterns=FIGURE_PATTERN, desc=plot_desc, **FIGURE_FILLS
-        )
         plot_func(timeseries, **kwargs)
-
-        logging.debug("Saving timeseries visual report at:")
-        logging.debug(f"\t{op.join(output, ts_saveloc)}")
-        os.makedirs(op.join(output, op.dirname(ts_saveloc)), exist_ok=True)
-        plt.savefig(op.join(output, ts_saveloc))
-        plt.close()
+        save_figure(get_figure_path(filename, output, plot_desc))
 
     # Plotting confounds as a design matrix
     if confounds is not None:
-        conf_saveloc = get_bids_savename(
-            filename, patterns=FIGURE_PATTERN, desc="designmatrix", **FIGURE_FILLS
-        )
-
         _, ax = plt.subplots(figsize=TS_FIGURE_SIZE)
-        plot_design_matrix(confounds, ax=ax)
-        logging.debug("Saving confounds visual report at:")
-        logging.debug(f"\t{op.join(output, conf_saveloc)}")
-
-        plt.savefig(op.join(output, conf_saveloc))
-        plt.close()
+        # Confounds may come as an array, which plot_design_matrix does not accept
+        plot_design_matrix(pd.DataFrame(confounds), ax=ax)
+        save_figure(get_figure_path(filename, output, "designmatrix"))
 
 
 def visual_report_fc(
@@ -363,9 +428,6 @@ def visual_report_fc(
     labels : Optional[list], optional
         Labels of the atlas ROIs, by default None
     """
-    fc_saveloc = get_bids_savename(
-        filename, patterns=FIGURE_PATTERN, desc="heatmap", **FIGURE_FILLS, **kwargs
-    )
     _, ax = plt.subplots(figsize=FC_FIGURE_SIZE)
 
     plot_matrix(matrix, labels=list(labels), axes=ax, vmin=-1, vmax=1)  # type: ignore
@@ -378,11 +440,329 @@ def visual_report_fc(
     # Ensure the labels are within the figure
     plt.tight_layout()
 
-    logging.debug("Saving functional connectivity matrices visual report at:")
-    logging.debug(f"\t{op.join(output, fc_saveloc)}")
+    save_figure(get_figure_path(filename, output, "heatmap", **kwargs))
 
-    plt.savefig(op.join(output, fc_saveloc))
-    plt.close()
+
+def is_up_to_date(figure_path: str, input_paths: list[str]) -> bool:
+    """Check whether a figure is more recent than all the files it is drawn from.
+
+    Inputs saved as binary sidecars (see `load_save.get_binary_sidecar`) are
+    considered as well.
+
+    Parameters
+    ----------
+    figure_path : str
+        Path to the figure
+    input_paths : list[str]
+        Paths to the input files
+
+    Returns
+    -------
+    bool
+        True if the figure exists and none of its inputs was modified after it.
+    """
+    if not op.exists(figure_path):
+        return False
+
+    figure_mtime = os.stat(figure_path).st_mtime_ns
+    return all(
+        os.stat(path).st_mtime_ns <= figure_mtime
+        for input_path in input_paths
+        for path in (input_path, get_binary_sidecar(input_path))
+        if op.exists(path)
+    )
+
+
+def render_session_reports(
+    filename: str,
+    output: str,
+    timeseries_path: Optional[str] = None,
+    fc_path: Optional[str] = None,
+    confounds: Optional[Union[pd.DataFrame, np.ndarray]] = None,
+    labels: Optional[Union[list, np.ndarray]] = None,
+    networks: Optional[pd.Series] = None,
+    meas: Optional[str] = None,
+    force: bool = False,
+    fast: bool = False,
+) -> list[str]:
+    """Render the visual reports of one session from its saved outputs, skipping the
+    figures that are more recent than their inputs.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the corresponding BIDS functional file
+    output : str
+        Path to the output directory
+    timeseries_path : Optional[str], optional
+        Path to the saved timeseries, by default None (no timeseries figures)
+    fc_path : Optional[str], optional
+        Path to the saved FC matrix, by default None (no heatmap)
+    confounds : Optional[Union[pd.DataFrame, np.ndarray]], optional
+        Confounds to plot as a design matrix, by default None
+    labels : Optional[Union[list, np.ndarray]], optional
+        Labels of the atlas ROIs, by default None
+    networks : Optional[pd.Series], optional
+        Networks of the atlas ROIs, by default None
+    meas : Optional[str], optional
+        Label of the connectivity measure, by default None
+    force : bool, optional
+        Render all the figures, even if up to date, by default False
+    fast : bool, optional
+        Draw the signal plot as a rasterized LineCollection, by default False
+
+    Returns
+    -------
+    list[str]
+        Paths to the rendered figures.
+    """
+    # Workers may not have a display
+    matplotlib.use("Agg")
+
+    rendered = []
+    if timeseries_path is not None:
+        timeseries = None
+        figures = [("carpetplot", plot_timeseries_carpet, {})]
+        figures += [
+            ("timeseries", plot_timeseries_signal, {"fast": fast, "rasterized": fast})
+        ]
+        for desc, plot_func, plot_kwargs in figures:
+            figure_path = get_figure_path(filename, output, desc)
+            if not force and is_up_to_date(figure_path, [timeseries_path]):
+                continue
+            if timeseries is None:
+                timeseries = load_array(timeseries_path)
+            plot_func(timeseries, labels=labels, networks=networks, **plot_kwargs)
+            save_figure(figure_path)
+            rendered.append(figure_path)
+
+        figure_path = get_figure_path(filename, output, "designmatrix")
+        if confounds is not None and (
+            force or not is_up_to_date(figure_path, [timeseries_path])
+        ):
+            _, ax = plt.subplots(figsize=TS_FIGURE_SIZE)
+            # Confounds may come as an array, which plot_design_matrix does not accept
+            plot_design_matrix(pd.DataFrame(confounds), ax=ax)
+            save_figure(figure_path)
+            rendered.append(figure_path)
+
+    if fc_path is not None:
+        figure_path = get_figure_path(filename, output, "heatmap", meas=meas)
+        if force or not is_up_to_date(figure_path, [fc_path]):
+            visual_report_fc(
+                load_array(fc_path), filename, output, labels=labels, meas=meas
+            )
+            rendered.append(figure_path)
+
+    return rendered
+
+
+def render_reports(
+    sessions: list[dict],
+    output: str,
+    labels: Optional[Union[list, np.ndarray]] = None,
+    networks: Optional[pd.Series] = None,
+    n_jobs: int = 1,
+    force: bool = False,
+    fast: bool = False,
+) -> list[str]:
+    """Render the per-session visual reports in a pool of processes.
+
+    The figures are drawn from the saved outputs, so that this stage can run on its
+    own to regenerate the reports without recomputing anything.
+
+    Parameters
+    ----------
+    sessions : list[dict]
+        Keyword arguments of `render_session_reports` for each session (filename,
+        timeseries_path, fc_path, confounds and meas)
+    output : str
+        Path to the output directory
+    labels : Optional[Union[list, np.ndarray]], optional
+        Labels of the atlas ROIs, by default None
+    networks : Optional[pd.Series], optional
+        Networks of the atlas ROIs, by default None
+    n_jobs : int, optional
+        Number of processes, by default 1
+    force : bool, optional
+        Render all the figures, even if up to date, by default False
+    fast : bool, optional
+        Draw the signal plots as rasterized LineCollections, by default False
+
+    Returns
+    -------
+    list[str]
+        Paths to the rendered figures.
+    """
+    if not sessions:
+        return []
+
+    logging.info(f"Rendering the visual reports of {len(sessions)} sessions ...")
+    rendered = Parallel(n_jobs=n_jobs)(
+        delayed(render_session_reports)(
+            output=output,
+            labels=labels,
+            networks=networks,
+            force=force,
+            fast=fast,
+            **session,
+        )
+        for session in sessions
+    )
+    rendered = [figure_path for figures in rendered for figure_path in figures]
+    logging.info(f"{len(rendered)} figures rendered, the others were up to date.")
+    return rendered
+
+
+def queue_reports(output: str, specs: list[dict]) -> str:
+    """Queue plot specifications, to be rendered later by `render_queued_reports`.
+
+    Arrays (resp. data frames) in the specifications are saved as .npy (resp. .tsv)
+    files in the queue folder and replaced by their path, under the key suffixed
+    with "_path".
+
+    Parameters
+    ----------
+    output : str
+        Path to the output directory
+    specs : list[dict]
+        Plot specifications, with a "kind" ("session" for the arguments of
+        `render_session_reports`, "interpolation" for those of `plot_interpolation`)
+
+    Returns
+    -------
+    str
+        Path to the queue manifest.
+    """
+    queue_dir = op.join(output, REPORT_QUEUE_DIRNAME)
+    os.makedirs(queue_dir, exist_ok=True)
+
+    lines = []
+    for spec in specs:
+        serializable = {}
+        for key, value in spec.items():
+            if isinstance(value, np.ndarray):
+                path = op.join(queue_dir, f"{uuid4().hex}.npy")
+                np.save(path, value)
+                serializable[f"{key}_path"] = path
+            elif isinstance(value, pd.DataFrame):
+                path = op.join(queue_dir, f"{uuid4().hex}.tsv")
+                value.to_csv(path, sep="\t", index=False)
+                serializable[f"{key}_path"] = path
+            elif value is not None:
+                serializable[key] = value
+        lines.append(json.dumps(serializable) + "\n")
+
+    queue_path = op.join(output, REPORT_QUEUE_FILENAME)
+    with REPORT_QUEUE_LOCK, open(queue_path, "a") as f:
+        f.writelines(lines)
+    return queue_path
+
+
+def render_queued_report(
+    spec: dict,
+    output: str,
+    labels: Optional[Union[list, np.ndarray]] = None,
+    networks: Optional[pd.Series] = None,
+    force: bool = False,
+) -> list[str]:
+    """Render a queued plot specification (see `queue_reports`).
+
+    Parameters
+    ----------
+    spec : dict
+        Plot specification, as read from the queue manifest
+    output : str
+        Path to the output directory
+    labels : Optional[Union[list, np.ndarray]], optional
+        Labels of the atlas ROIs, by default None
+    networks : Optional[pd.Series], optional
+        Networks of the atlas ROIs, by default None
+    force : bool, optional
+        Render all the figures, even if up to date, by default False
+
+    Returns
+    -------
+    list[str]
+        Paths to the rendered figures.
+    """
+    matplotlib.use("Agg")
+
+    spec = dict(spec)
+    kind = spec.pop("kind")
+    if kind == "interpolation":
+        plot_interpolation(
+            np.load(spec["ts_path"]),
+            np.load(spec["interpolated_ts_path"]),
+            spec["filename"],
+            output,
+            fast=spec.get("fast", False),
+        )
+        return [get_figure_path(spec["filename"], output, "interpolatedtimeseries")]
+
+    if "confounds_path" in spec:
+        # Confounds are queued as .npy if they were given as an array
+        confounds_path = spec.pop("confounds_path")
+        if confounds_path.endswith(".npy"):
+            spec["confounds"] = np.load(confounds_path)
+        else:
+            spec["confounds"] = pd.read_csv(confounds_path, sep="\t")
+    return render_session_reports(
+        output=output, labels=labels, networks=networks, force=force, **spec
+    )
+
+
+def render_queued_reports(
+    output: str,
+    labels: Optional[Union[list, np.ndarray]] = None,
+    networks: Optional[pd.Series] = None,
+    n_jobs: int = 1,
+    force: bool = False,
+) -> list[str]:
+    """Render in bulk the plot specifications queued in an output directory, and
+    empty the queue.
+
+    Parameters
+    ----------
+    output : str
+        Path to the output directory
+    labels : Optional[Union[list, np.ndarray]], optional
+        Labels of the atlas ROIs, by default None
+    networks : Optional[pd.Series], optional
+        Networks of the atlas ROIs, by default None
+    n_jobs : int, optional
+        Number of processes, by default 1
+    force : bool, optional
+        Render all the figures, even if up to date, by default False
+
+    Returns
+    -------
+    list[str]
+        Paths to the rendered figures.
+    """
+    queue_path = op.join(output, REPORT_QUEUE_FILENAME)
+    if not op.exists(queue_path):
+        logging.info("No queued reports to render.")
+        return []
+
+    with open(queue_path) as f:
+        specs = [json.loads(line) for line in f if line.strip()]
+
+    logging.info(f"Rendering {len(specs)} queued reports ...")
+    rendered = Parallel(n_jobs=n_jobs)(
+        delayed(render_queued_report)(
+            spec, output, labels=labels, networks=networks, force=force
+        )
+        for spec in specs
+    )
+
+    # Only empty the queue once everything was rendered
+    os.remove(queue_path)
+    shutil.rmtree(op.join(output, REPORT_QUEUE_DIRNAME), ignore_errors=True)
+
+    rendered = [figure_path for figures in rendered for figure_path in figures]
+    logging.info(f"{len(rendered)} figures rendered, the others were up to date.")
+    return rendered
 
 
 def group_report_censoring(good_timepoints_df, output) -> None:
@@ -503,15 +883,16 @@ def group_report_fc_dist(
 
 
 def group_reportlet_fc_dist(
-    fc_matrices: list[np.ndarray],
+    fc_matrices: Union[list[np.ndarray], np.ndarray],
     output: str,
 ) -> None:
     """Plot and save the functional connectivity density distributions.
 
     Parameters
     ----------
-    fc_matrices : list[np.ndarray]
-        List of functional connectivity matrices
+    fc_matrices : Union[list[np.ndarray], np.ndarray]
+        Array of shape (n_sessions, n_edges) with the vectorized upper triangles of
+        the functional connectivity matrices (see `load_save.load_fc_edges`)
     output : str
         Path to the output directory
     """
@@ -542,29 +923,223 @@ def group_reportlet_fc_dist(
     plt.close()
 
 
-def group_reportlet_qc_fc(
-    fc_matrices: list[np.ndarray],
+def permutation_indices(
+    n_samples: int,
+    n_permutation: int = N_PERMUTATION,
+    seed: Optional[Union[int, np.random.SeedSequence]] = PERMUTATION_SEED,
+) -> np.ndarray:
+    """Draw all the permutations used to build the QC-FC null distribution at once.
+
+    Parameters
+    ----------
+    n_samples : int
+        Number of samples (sessions) to permute
+    n_permutation : int, optional
+        Number of permutations, by default N_PERMUTATION
+    seed : Optional[Union[int, np.random.SeedSequence]], optional
+        Seed of the random generator, by default PERMUTATION_SEED
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n_permutation, n_samples) where each row is a permutation.
+    """
+    rng = np.random.default_rng(seed=seed)
+    return rng.permuted(np.tile(np.arange(n_samples), (n_permutation, 1)), axis=1)
+
+
+def standardize_rows(data: np.ndarray) -> np.ndarray:
+    """Center each row and scale it to unit norm, so that the Pearson correlation
+    between two standardized rows is their dot product.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Array whose last axis is the sample axis
+
+    Returns
+    -------
+    np.ndarray
+        Standardized array (rows with zero variance are filled with NaNs, as
+        `np.corrcoef` would return).
+    """
+    data = np.asarray(data, dtype=float)
+    centered = data - data.mean(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return centered / np.linalg.norm(centered, axis=-1, keepdims=True)
+
+
+def qc_fc_null(
+    edges_std: np.ndarray,
+    iqm_std: np.ndarray,
+    permutations: np.ndarray,
+) -> np.ndarray:
+    """Compute the QC-FC correlations under the null hypothesis for a chunk of edges.
+
+    Permuting the edge values is equivalent to applying the inverse permutation to
+    the IQM, hence all the null correlations are obtained with a single matrix
+    product. Memory is bounded by ``n_edges * n_permutation`` floats, so the edges
+    should be provided by chunks of QC_FC_CHUNK_SIZE.
+
+    Parameters
+    ----------
+    edges_std : np.ndarray
+        Standardized edges of shape (n_edges, n_samples)
+    iqm_std : np.ndarray
+        Standardized IQM of shape (n_samples,)
+    permutations : np.ndarray
+        Permutations of shape (n_permutation, n_samples)
+
+    Returns
+    -------
+    np.ndarray
+        Null correlations of shape (n_edges, n_permutation)
+    """
+    permuted_iqm = iqm_std[np.argsort(permutations, axis=1)]
+    return edges_std @ permuted_iqm.T
+
+
+class HistogramSketch:
+    """Fixed-bin histogram accumulating a distribution chunk by chunk.
+
+    Memory is O(bins) regardless of the number of accumulated values, which makes it
+    suitable for null distributions of billions of correlations.
+
+    Parameters
+    ----------
+    bins : int, optional
+        Number of bins, by default QC_FC_N_BINS
+    value_range : tuple, optional
+        Range of the accumulated values (values outside are clipped),
+        by default (-1, 1)
+    """
+
+    def __init__(self, bins: int = QC_FC_N_BINS, value_range: tuple = (-1.0, 1.0)):
+        self.edges = np.linspace(value_range[0], value_range[1], bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    @property
+    def n_samples(self) -> int:
+        return int(self.counts.sum())
+
+    @property
+    def centers(self) -> np.ndarray:
+        return (self.edges[:-1] + self.edges[1:]) / 2
+
+    def update(self, values: np.ndarray) -> None:
+        """Accumulate the finite elements of `values` in the histogram."""
+        values = np.ravel(values)
+        values = np.clip(values[np.isfinite(values)], self.edges[0], self.edges[-1])
+        self.counts += np.histogram(values, bins=self.edges)[0]
+
+    def merge(self, other: "HistogramSketch") -> None:
+        """Add the counts of another sketch with the same bins."""
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge histogram sketches with different bins.")
+        self.counts += other.counts
+
+    def cdf(self, values: np.ndarray) -> np.ndarray:
+        """Evaluate the cumulative distribution (linear within bins) at `values`."""
+        cumulative = np.concatenate(([0], np.cumsum(self.counts))) / self.n_samples
+        return np.interp(values, self.edges, cumulative)
+
+    def density(self) -> np.ndarray:
+        """Kernel density estimate at the bin centers, using Scott's rule of thumb
+        for the bandwidth (as `seaborn.kdeplot` does by default)."""
+        width = self.edges[1] - self.edges[0]
+        density = self.counts / (self.n_samples * width)
+        mean = np.sum(self.centers * self.counts) / self.n_samples
+        std = np.sqrt(np.sum((self.centers - mean) ** 2 * self.counts) / self.n_samples)
+        bandwidth = std * self.n_samples ** (-1 / 5)
+        return gaussian_filter1d(density, max(bandwidth / width, 1), mode="constant")
+
+
+def ks_2samp_sketch(sample: np.ndarray, sketch: HistogramSketch) -> float:
+    """Two-sample Kolmogorov-Smirnov statistic between a sample and a distribution
+    accumulated in a :obj:`HistogramSketch`.
+
+    Parameters
+    ----------
+    sample : np.ndarray
+        Sample held in memory
+    sketch : HistogramSketch
+        Histogram of the second sample
+
+    Returns
+    -------
+    float
+        KS statistic, accurate up to the resolution of the histogram bins.
+    """
+    sample = np.sort(sample[np.isfinite(sample)])
+    n_sample = sample.size
+    cdf = sketch.cdf(sample)
+    # The supremum is reached on either side of the steps of the empirical CDF
+    return max(
+        np.max(np.arange(1, n_sample + 1) / n_sample - cdf),
+        np.max(cdf - np.arange(n_sample) / n_sample),
+    )
+
+
+def _qc_fc_null_chunk(
+    edges_std: np.ndarray,
+    iqm_std: np.ndarray,
+    seed: np.random.SeedSequence,
+    streaming: bool = True,
+) -> Union[np.ndarray, HistogramSketch]:
+    """Worker computing the null distribution of one chunk of edges."""
+    permutations = permutation_indices(iqm_std.size, seed=seed)
+    correlations_null = qc_fc_null(edges_std, iqm_std, permutations)
+
+    if not streaming:
+        return correlations_null.ravel()
+
+    null_sketch = HistogramSketch()
+    null_sketch.update(correlations_null)
+    return null_sketch
+
+
+def compute_qc_fc(
+    fc_matrices: Union[list[np.ndarray], np.ndarray],
     iqms_df: pd.DataFrame,
-    output: str,
-) -> dict:
-    """Plot and save the QC-FC distributions.
+    streaming: bool = True,
+    n_jobs: int = 1,
+) -> tuple[dict, dict]:
+    """Compute the QC-FC distributions and their null distributions.
+
+    The work is split into (IQM, chunk of edges) tasks that are distributed over a
+    pool of `n_jobs` processes. The permutations of each chunk are drawn from a seed
+    spawned from PERMUTATION_SEED, so the results do not depend on `n_jobs`.
 
     Parameters
     ----------
-    fc_matrices : list[np.ndarray]
-        List of functional connectivity matrices
+    fc_matrices : Union[list[np.ndarray], np.ndarray]
+        List of functional connectivity matrices, or array of shape
+        (n_sessions, n_edges) with their vectorized upper triangles
     iqms_df : pd.Dataframe
         Dataframe containing the image quality metrics to correlate with
-    output : str
-        Path to the output directory
-    """
+    streaming : bool, optional
+        Accumulate the null distributions in :obj:`HistogramSketch`, by default True.
+        Otherwise, every null correlation is kept in memory (n_edges x N_PERMUTATION
+        floats per IQM): exact, but several GB for large atlases.
+    n_jobs : int, optional
+        Number of processes, by default 1
 
-    # Stack the list of arrays into a 3D matrix
-    fc_matrices = np.stack(fc_matrices, axis=2)
+    Returns
+    -------
+    tuple[dict, dict]
+        Two dictionaries indexed by IQM, one with the QC-FC distributions and one
+        with the null distributions (arrays, or sketches if `streaming`).
+    """
+    if isinstance(fc_matrices, np.ndarray) and fc_matrices.ndim == 2:
+        # Upper triangles already vectorized (e.g. loaded from the group store)
+        fc_matrices = fc_matrices.T
+    else:
+        # Stack the list of arrays into a 3D matrix
+        fc_matrices = np.stack(fc_matrices, axis=2)
 
-    # Keep only upper triangle as the matrix is symmetric
-    upper_triangle_indices = np.triu_indices(fc_matrices.shape[0], k=1)
-    fc_matrices = fc_matrices[upper_triangle_indices]
+        # Keep only upper triangle as the matrix is symmetric
+        upper_triangle_indices = np.triu_indices(fc_matrices.shape[0], k=1)
+        fc_matrices = fc_matrices[upper_triangle_indices]
 
     if fc_matrices.shape[1] != iqms_df.shape[0]:
         raise ValueError(
@@ -576,19 +1151,89 @@ def group_reportlet_qc_fc(
             "We need at least two functional connectivity matrices to be able to compute its correlation with IQMs."
         )
 
+    # Standardize the edges once, correlations become matrix products
+    edges_std = standardize_rows(fc_matrices)
+    iqms_std = {
+        iqm_column: standardize_rows(iqms_df[iqm_column].to_numpy())
+        for iqm_column in iqms_df.columns
+    }
+
+    logging.debug("Compute QC-FC correlation for each edge.")
+    qc_fc_dict = {
+        iqm_column: edges_std @ iqm_std for iqm_column, iqm_std in iqms_std.items()
+    }
+
+    ## Permutation analyses
+    logging.debug("Compute QC-FC distribution under the null hypothesis.")
+    chunk_starts = range(0, edges_std.shape[0], QC_FC_CHUNK_SIZE)
+    chunk_seeds = np.random.SeedSequence(PERMUTATION_SEED).spawn(len(chunk_starts))
+    tasks = [
+        (iqm_column, start, seed)
+        for iqm_column in iqms_std
+        for start, seed in zip(chunk_starts, chunk_seeds)
+    ]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_qc_fc_null_chunk)(
+            edges_std[start : start + QC_FC_CHUNK_SIZE],
+            iqms_std[iqm_column],
+            seed,
+            streaming=streaming,
+        )
+        for iqm_column, start, seed in tasks
+    )
+
+    # Reduce the chunks of each IQM
+    null_dict = {}
+    for iqm_column in iqms_std:
+        chunks = [
+            res for (column, _, _), res in zip(tasks, results) if column == iqm_column
+        ]
+        if streaming:
+            null_dict[iqm_column] = HistogramSketch()
+            for null_sketch in chunks:
+                null_dict[iqm_column].merge(null_sketch)
+        else:
+            null_dict[iqm_column] = np.concatenate(chunks)
+
+    return qc_fc_dict, null_dict
+
+
+def group_reportlet_qc_fc(
+    fc_matrices: Union[list[np.ndarray], np.ndarray],
+    iqms_df: pd.DataFrame,
+    output: str,
+    streaming: bool = True,
+    n_jobs: int = 1,
+) -> dict:
+    """Plot and save the QC-FC distributions.
+
+    Parameters
+    ----------
+    fc_matrices : Union[list[np.ndarray], np.ndarray]
+        List of functional connectivity matrices, or array of shape
+        (n_sessions, n_edges) with their vectorized upper triangles
+    iqms_df : pd.Dataframe
+        Dataframe containing the image quality metrics to correlate with
+    output : str
+        Path to the output directory
+    streaming : bool, optional
+        Accumulate the null distribution in a fixed-bin histogram, by default True.
+        Otherwise, every null correlation is kept in memory: exact, but several GB
+        for large atlases.
+    n_jobs : int, optional
+        Number of processes computing the distributions, by default 1
+    """
+    qc_fc_dict, null_dict = compute_qc_fc(
+        fc_matrices, iqms_df, streaming=streaming, n_jobs=n_jobs
+    )
+
+    # Figures are rendered once all the statistics have been reduced
     fig, axs = plt.subplots(1, 3, figsize=FC_FIGURE_SIZE)
 
     # Iterate over each IQM
-    qc_fc_dict = dict()
     for i, iqm_column in enumerate(iqms_df.columns):
-        # Create an empty list to store correlations for each edge
-        qc_fcs = []
-
-        # Iterate over each edge
-        logging.debug("Compute QC-FC correlation for each edge.")
-        for e in range(fc_matrices.shape[0]):
-            qc_fc = np.corrcoef(fc_matrices[e, :], iqms_df[iqm_column])[0, 1]
-            qc_fcs.append(qc_fc)
+        qc_fcs = qc_fc_dict[iqm_column]
+        correlations_null = null_dict[iqm_column]
 
         # Create a density distribution plot for the current IQM
         logging.debug("Create the density distribution plot.")
@@ -596,37 +1241,28 @@ def group_reportlet_qc_fc(
             qc_fcs, fill=True, label="QC-FC distribution", linewidth=3, ax=axs[i]
         )
 
-        # Save the QC-FC distributions in a dictionary
-        qc_fc_dict[iqm_column] = qc_fcs
-
-        ## Permutation analyses
-        logging.debug("Compute QC-FC distribution under the null hypothesis.")
-        correlations_null = []
-        for e in range(fc_matrices.shape[0]):
-            for _ in range(N_PERMUTATION):
-                permuted_fc = fc_matrices[
-                    e, np.random.default_rng(seed=42).permutation(fc_matrices.shape[1])
-                ]
-                # Correlation under null hypothesis
-                correlation = np.corrcoef(permuted_fc, iqms_df[iqm_column])[0, 1]
-                correlations_null.append(correlation)
-
         # Create a density distribution plot for null distribution
         logging.debug("Create the density distribution plot for the null distribution.")
-        sns.kdeplot(
-            correlations_null,
-            fill=False,
+        null_style = dict(
             color="red",
             label="Dist under null hypothesis",
             linewidth=3,
             linestyle="dashed",
-            ax=axs[i],
         )
+        if streaming:
+            axs[i].plot(
+                correlations_null.centers, correlations_null.density(), **null_style
+            )
+        else:
+            sns.kdeplot(correlations_null, fill=False, ax=axs[i], **null_style)
         plt.legend(fontsize=LABELSIZE + 2)
 
         # Compute percent match between the two distributions
         logging.debug("Compute percent match between the two distributions.")
-        ks_statistic, _ = ks_2samp(qc_fcs, correlations_null)
+        if streaming:
+            ks_statistic = ks_2samp_sketch(qc_fcs, correlations_null)
+        else:
+            ks_statistic, _ = ks_2samp(qc_fcs, correlations_null)
         percent_match_ks = (1 - ks_statistic) * 100
 
         # Plot the box in red if the correlation is significant
@@ -759,17 +1395,21 @@ def group_reportlet_qc_fc_euclidean(
 
 def group_report(
     good_timepoints_df: pd.DataFrame,
-    fc_matrices: list[np.ndarray],
+    fc_matrices: Union[list[np.ndarray], np.ndarray],
     iqms_df: pd.DataFrame,
     atlas_filename: str,
     output: str,
+    streaming: bool = True,
+    n_jobs: int = 1,
 ) -> None:
     """Generate a group report."""
 
     # Generate each reportlets
     group_report_censoring(good_timepoints_df, output)
     group_reportlet_fc_dist(fc_matrices, output)
-    qc_fc_dict = group_reportlet_qc_fc(fc_matrices, iqms_df, output)
+    qc_fc_dict = group_reportlet_qc_fc(
+        fc_matrices, iqms_df, output, streaming=streaming, n_jobs=n_jobs
+    )
     group_reportlet_qc_fc_euclidean(qc_fc_dict, atlas_filename, output)
 
     # Assemble reportlets into a single HTML report
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from nilearn.connectome import ConnectivityMeasure, sym_matrix_to_vec
+from sklearn.covariance import GraphicalLassoCV, LedoitWolf
+
+from fmri.connectivity import compute_connectivity_batch
+
+
+def make_time_series(n_sessions=3, n_volumes=80, n_regions=5):
+    rng = np.random.default_rng(0)
+    mixing = rng.standard_normal((n_regions, n_regions))
+    return [
+        rng.standard_normal((n_volumes, n_regions)) @ mixing
+        for _ in range(n_sessions)
+    ]
+
+
+def test_compute_connectivity_batch_matches_connectivity_measure():
+    time_series = make_time_series()
+    estimator = LedoitWolf(store_precision=False)
+
+    expected = ConnectivityMeasure(
+        cov_estimator=estimator,
+        kind="correlation",
+        vectorize=True,
+        discard_diagonal=True,
+    ).fit_transform(time_series)
+    fc_matrices, fit_report = compute_connectivity_batch(
+        time_series, estimator, connectivity_kind="correlation", n_jobs=2
+    )
+
+    assert fc_matrices.shape == (3, 5, 5)
+    np.testing.assert_allclose(
+        sym_matrix_to_vec(fc_matrices, discard_diagonal=True), expected
+    )
+    assert len(fit_report) == 3
+    assert (fit_report["duration"] >= 0).all()
+
+
+def test_compute_connectivity_batch_shared_alpha():
+    time_series = make_time_series()
+    estimator = GraphicalLassoCV(alphas=3, max_iter=200)
+
+    fc_matrices, fit_report = compute_connectivity_batch(
+        time_series,
+        estimator,
+        connectivity_kind="precision",
+        shared_alpha=True,
+        warm_start=True,
+    )
+
+    assert fc_matrices.shape == (3, 5, 5)
+    assert fit_report["alpha"].nunique() == 1
+    assert fit_report["converged"].all()
+
+    with pytest.raises(ValueError, match="shared alpha"):
+        compute_connectivity_batch(time_series, estimator, warm_start=True)
+
+
+@pytest.mark.parametrize("solver_available", [True, False])
+def test_compute_connectivity_batch_warm_start(monkeypatch, solver_available):
+    import fmri.connectivity as connectivity
+
+    if not solver_available:
+        monkeypatch.setattr(connectivity, "_graphical_lasso", None)
+
+    time_series = make_time_series()
+    estimator = GraphicalLassoCV(alphas=3, max_iter=200)
+    cold, _ = compute_connectivity_batch(
+        time_series, estimator, connectivity_kind="precision", shared_alpha=True
+    )
+    warm, fit_report = compute_connectivity_batch(
+        time_series,
+        estimator,
+        connectivity_kind="precision",
+        shared_alpha=True,
+        warm_start=True,
+    )
+
+    # Both runs converge to the same optimum of the (convex) problem
+    np.testing.assert_allclose(warm, cold, rtol=1e-2, atol=1e-3)
+    assert (fit_report["n_iter"] >= 1).all()
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+from nilearn.signal import _handle_scrubbed_volumes, _sanitize_confounds, clean
+
+from fmri.denoising import interpolate_and_denoise_batch
+
+
+def make_runs(lengths, n_regions=6, n_confounds=4):
+    rng = np.random.default_rng(0)
+    time_series, confounds, sample_mask = [], [], []
+    for n_volumes in lengths:
+        time_series.append(rng.standard_normal((n_volumes, n_regions)).cumsum(0))
+        confounds.append(
+            pd.DataFrame(rng.standard_normal((n_volumes, n_confounds)))
+        )
+        mask = np.ones(n_volumes, dtype=bool)
+        mask[rng.choice(np.arange(5, n_volumes - 5), 8, replace=False)] = False
+        sample_mask.append(mask)
+    return time_series, confounds, sample_mask
+
+
+@pytest.mark.parametrize("low_pass", [None, 0.1])
+@pytest.mark.parametrize("with_confounds", [True, False])
+def test_interpolate_and_denoise_batch(low_pass, with_confounds):
+    time_series, confounds, sample_mask = make_runs([120, 120, 90])
+    if not with_confounds:
+        confounds = [None] * len(confounds)
+
+    denoised, interpolated, interpolated_confounds = interpolate_and_denoise_batch(
+        time_series, confounds, sample_mask, t_r=2.0, low_pass=low_pass, n_jobs=2
+    )
+
+    # Reference: one run at a time, through Nilearn
+    for i, (ts, conf, mask) in enumerate(zip(time_series, confounds, sample_mask)):
+        conf = _sanitize_confounds(ts.shape[0], n_runs=1, confounds=conf)
+        expected_ts, expected_conf = _handle_scrubbed_volumes(
+            signals=ts.copy(),
+            confounds=conf,
+            sample_mask=mask,
+            filter_type="butterworth",
+            t_r=2.0,
+        )
+        expected = clean(
+            expected_ts,
+            standardize="zscore_sample",
+            confounds=expected_conf,
+            low_pass=low_pass,
+            t_r=2.0,
+        )
+
+        np.testing.assert_allclose(interpolated[i], expected_ts)
+        if with_confounds:
+            np.testing.assert_allclose(interpolated_confounds[i], expected_conf)
+        else:
+            assert interpolated_confounds[i] is None
+        np.testing.assert_allclose(denoised[i], expected, atol=1e-10)
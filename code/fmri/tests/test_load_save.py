@@ -1,4 +1,6 @@
 import pytest
+import numpy as np
+import nibabel as nb
 import os
 import random
 import pandas as pd
@@ -181,3 +183,390 @@ def test_check_existing_output(return_existing, return_output, fc_label, tmp_pat
     for file in existing_filenames:
         (tmp_path / file).unlink()
     tmp_path.rmdir()
+
+
+@pytest.mark.parametrize("output_format", ["tsv", "npy", "both"])
+def test_save_output_binary(output_format, tmp_path):
+    func_filename = ["sub-1/func/sub-1_bold.nii", "sub-2/func/sub-2_bold.nii"]
+    data_list = [np.random.rand(10, 4), np.random.rand(10, 4)]
+
+    FAKE_PATTERN: list = ["sub-{subject}[_meas-{meas}]" "_{suffix}{extension}"]
+
+    fl.save_output(
+        data_list,
+        func_filename,
+        str(tmp_path),
+        output_format=output_format,
+        patterns=FAKE_PATTERN,
+        meas="correlation",
+        **fl.FC_FILLS,
+    )
+
+    tsv_path = tmp_path / "sub-1_meas-correlation_connectivity.tsv"
+    npy_path = tmp_path / "sub-1_meas-correlation_connectivity.npy"
+    assert tsv_path.exists() == (output_format != "npy")
+    assert npy_path.exists() == (output_format != "tsv")
+
+    missing_file = fl.check_existing_output(
+        str(tmp_path),
+        func_filename + ["sub-3/func/sub-3_bold.nii"],
+        patterns=FAKE_PATTERN,
+        meas="correlation",
+        **fl.FC_FILLS,
+    )
+    assert missing_file == ["sub-3/func/sub-3_bold.nii"]
+
+    loaded = fl.load_array(str(tsv_path))
+    assert isinstance(loaded, np.memmap) == (output_format != "tsv")
+    assert np.allclose(loaded, data_list[0])
+
+
+def test_save_output_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        fl.save_output(
+            [np.zeros((2, 2))],
+            ["sub-1/func/sub-1_bold.nii"],
+            str(tmp_path),
+            output_format="csv",
+            patterns=["sub-{subject}_{suffix}{extension}"],
+            **fl.FC_FILLS,
+        )
+
+
+def test_group_store(tmp_path):
+    func_filename = [
+        "sub-1/ses-1/func/sub-1_ses-1_task-rest_bold.nii.gz",
+        "sub-1/ses-2/func/sub-1_ses-2_task-rest_bold.nii.gz",
+        "sub-1/ses-3/func/sub-1_ses-3_task-rest_bold.nii.gz",
+    ]
+    fc_matrices = [np.random.rand(5, 5) for _ in func_filename]
+    upper_triangle_indices = np.triu_indices(5, k=1)
+
+    store_path = fl.append_group_store(
+        fc_matrices[:2], func_filename[:2], str(tmp_path), meas="correlation"
+    )
+    # Appending is incremental and recomputed sessions are overwritten
+    fc_matrices[1] = np.random.rand(5, 5)
+    fl.append_group_store(
+        fc_matrices[1:], func_filename[1:], str(tmp_path), meas="correlation"
+    )
+
+    edges, index = fl.load_group_store(store_path)
+    assert edges.shape == (3, 10)
+    assert index["session"].tolist() == ["1", "2", "3"]
+
+    fc_paths = index["filename"].tolist()[::-1]
+    edges, index = fl.load_group_store(store_path, fc_paths)
+    assert index["filename"].tolist() == fc_paths
+    for row, matrix in zip(edges, fc_matrices[::-1]):
+        assert np.allclose(row, matrix[upper_triangle_indices])
+
+    with pytest.raises(ValueError):
+        fl.load_group_store(store_path, ["sub-2/func/sub-2_connectivity.tsv"])
+
+    with pytest.raises(ValueError):
+        fl.append_group_store(
+            [np.zeros((4, 4))], func_filename[:1], str(tmp_path), meas="correlation"
+        )
+
+
+def test_load_fc_edges(tmp_path, caplog):
+    func_filename = [
+        "sub-1/ses-1/func/sub-1_ses-1_task-rest_bold.nii.gz",
+        "sub-1/ses-2/func/sub-1_ses-2_task-rest_bold.nii.gz",
+    ]
+    fc_matrices = [np.random.rand(5, 5) for _ in func_filename]
+    output = str(tmp_path)
+    naming = dict(patterns=fl.FC_PATTERN, meas="correlation", **fl.FC_FILLS)
+    fl.save_output(fc_matrices, func_filename, output, **naming)
+    fc_filenames = [
+        op.join(output, fl.get_bids_savename(filename, **naming))
+        for filename in func_filename
+    ]
+
+    # From the individual files
+    from_files = fl.load_fc_edges(fc_filenames, output, "correlation")
+    assert from_files.shape == (2, 10)
+
+    # From the group store, with the same shape and values
+    fl.append_group_store(fc_matrices, func_filename, output, meas="correlation")
+    with caplog.at_level("INFO"):
+        from_store = fl.load_fc_edges(fc_filenames, output, "correlation")
+    assert "Loaded 2 matrices from" in caplog.text
+    np.testing.assert_allclose(from_store, from_files)
+
+
+def test_get_layout_fingerprint(tmp_path):
+    func_dir = tmp_path / "sub-1" / "ses-1" / "func"
+    func_dir.mkdir(parents=True)
+    (tmp_path / "sub-2" / "anat").mkdir(parents=True)
+
+    fingerprint = fl.get_layout_fingerprint(str(tmp_path))
+    assert set(fingerprint) == {
+        ".",
+        "sub-1",
+        "sub-1/ses-1",
+        "sub-1/ses-1/func",
+        "sub-2",
+        "sub-2/anat",
+    }
+
+    # Adding a file only changes the modification time of its folder
+    os.utime(func_dir, ns=(0, 0))
+    fingerprint = fl.get_layout_fingerprint(str(tmp_path))
+    (func_dir / "sub-1_ses-1_task-rest_bold.nii.gz").write_text("")
+    new_fingerprint = fl.get_layout_fingerprint(str(tmp_path))
+    assert new_fingerprint["sub-1/ses-1/func"] != fingerprint["sub-1/ses-1/func"]
+    assert new_fingerprint["sub-2"] == fingerprint["sub-2"]
+
+
+def test_get_affines_and_trs(tmp_path):
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+    filenames = []
+    for i in range(3):
+        filename = str(tmp_path / f"sub-{i}_task-rest_bold.nii.gz")
+        nb.Nifti1Image(np.zeros((4, 4, 4, 2), dtype="float32"), affine).to_filename(
+            filename
+        )
+        filenames.append(filename)
+
+    class MockLayout:
+        n_calls = 0
+
+        def get_metadata(self, filename):
+            self.n_calls += 1
+            return {"RepetitionTime": 1.6}
+
+    layout = MockLayout()
+    cache_file = str(tmp_path / "cache" / "headers.json")
+    affines, t_rs = fl.get_affines_and_trs(filenames, layout, cache_file=cache_file)
+    assert all(np.allclose(file_affine, affine) for file_affine in affines)
+    assert t_rs == [1.6] * 3
+    assert layout.n_calls == 3
+
+    # Second call is served from the cache, except for the modified file
+    os.utime(filenames[0], ns=(0, 0))
+    affines, t_rs = fl.get_affines_and_trs(filenames, layout, cache_file=cache_file)
+    assert t_rs == [1.6] * 3
+    assert layout.n_calls == 4
+
+
+def test_get_raw_signals_path(tmp_path):
+    func_file = tmp_path / "sub-1_task-rest_bold.nii.gz"
+    func_file.write_text("")
+
+    path = fl.get_raw_signals_path("/cache", str(func_file), "/atlas/difumo64.nii.gz")
+    assert path.startswith("/cache/raw_signals/sub-1_task-rest_bold_")
+    assert path.endswith(".npy")
+
+    # Same inputs share the same key, another atlas or a modified file do not
+    assert path == fl.get_raw_signals_path(
+        "/cache", str(func_file), "/atlas/difumo64.nii.gz"
+    )
+    assert path != fl.get_raw_signals_path(
+        "/cache", str(func_file), "/atlas/difumo128.nii.gz"
+    )
+    os.utime(func_file, ns=(0, 0))
+    assert path != fl.get_raw_signals_path(
+        "/cache", str(func_file), "/atlas/difumo64.nii.gz"
+    )
+
+
+def test_get_resampled_atlas(tmp_path):
+    atlas = nb.Nifti1Image(np.random.rand(10, 10, 10, 3).astype("float32"), np.eye(4))
+    atlas_file = str(tmp_path / "maps.nii.gz")
+    atlas.to_filename(atlas_file)
+    target = nb.Nifti1Image(
+        np.zeros((5, 5, 5, 2), dtype="float32"), np.diag([2, 2, 2, 1])
+    )
+    target_file = str(tmp_path / "sub-1_task-rest_bold.nii.gz")
+    target.to_filename(target_file)
+
+    cache_dir = str(tmp_path / "atlases")
+    resampled_file = fl.get_resampled_atlas(atlas_file, target_file, cache_dir)
+    resampled = nb.load(resampled_file)
+    assert resampled.shape == (5, 5, 5, 3)
+    np.testing.assert_allclose(resampled.affine, target.affine)
+
+    # The second call reuses the cached file
+    mtime = os.stat(resampled_file).st_mtime_ns
+    assert fl.get_resampled_atlas(atlas_file, target_file, cache_dir) == resampled_file
+    assert os.stat(resampled_file).st_mtime_ns == mtime
+    assert os.listdir(cache_dir) == [op.basename(resampled_file)]
+
+
+def test_connectivity_state(tmp_path):
+    output = str(tmp_path)
+    state = fl.load_connectivity_state(output, "correlation")
+    assert state == {"sessions": [], "group": {}, "stale": []}
+
+    # First run: the group estimate is computed on all the sessions
+    group = {"alpha": 0.1, "sessions": ["ses-1", "ses-2"]}
+    state = fl.update_connectivity_state(state, ["ses-1", "ses-2"], group=group)
+    assert state["stale"] == ["group_report"]
+    fl.save_connectivity_state(state, output, "correlation", np.eye(3))
+
+    state = fl.load_connectivity_state(output, "correlation")
+    alpha, covariance = fl.load_group_estimate(state, output)
+    assert alpha == 0.1
+    np.testing.assert_array_equal(covariance, np.eye(3))
+
+    # Incremental run: the group estimate is reused, hence stale
+    state = fl.update_connectivity_state(state, ["ses-3"])
+    assert state["sessions"] == ["ses-1", "ses-2", "ses-3"]
+    assert state["stale"] == ["group_estimate", "group_report"]
+
+
+def test_provenance_manifest(tmp_path):
+    func_filename = [str(tmp_path / "sub-1_bold.nii"), str(tmp_path / "sub-2_bold.nii")]
+    for filename in func_filename:
+        with open(filename, "w") as f:
+            f.write("bold")
+    output = str(tmp_path / "output")
+    params = {"atlas": "DiFuMo64", "low_pass": None}
+
+    FAKE_PATTERN: list = ["sub-{subject}[_meas-{meas}]" "_{suffix}{extension}"]
+    naming = dict(patterns=FAKE_PATTERN, meas="correlation", **fl.FC_FILLS)
+
+    fl.save_output([np.eye(2)], func_filename[:1], output, params=params, **naming)
+    assert op.exists(fl.get_manifest_path(output))
+
+    missing, existing = fl.check_existing_output(
+        output, func_filename, return_existing=True, params=params, **naming
+    )
+    assert missing == func_filename[1:]
+    assert existing == func_filename[:1]
+
+    # Outputs computed with other parameters or from a modified input are not reused
+    other_params = {"atlas": "DiFuMo64", "low_pass": 0.08}
+    missing = fl.check_existing_output(
+        output, func_filename, params=other_params, **naming
+    )
+    assert missing == func_filename
+
+    # Recorded outputs deleted from the disk are missing
+    output_file = op.join(output, fl.get_bids_savename(func_filename[0], **naming))
+    os.rename(output_file, f"{output_file}.bak")
+    missing = fl.check_existing_output(output, func_filename, params=params, **naming)
+    assert missing == func_filename
+    os.rename(f"{output_file}.bak", output_file)
+
+    os.utime(func_filename[0], ns=(0, 0))
+    missing = fl.check_existing_output(output, func_filename, params=params, **naming)
+    assert missing == func_filename
+
+
+@pytest.mark.parametrize(
+    "patterns, fills",
+    [
+        (fl.FC_PATTERN, dict(meas="correlation", **fl.FC_FILLS)),
+        (fl.TIMESERIES_PATTERN, fl.TIMESERIES_FILLS),
+        (fl.CONFOUND_PATTERN, fl.CONFOUND_FILLS),
+        (fl.FIGURE_PATTERN, dict(desc="heatmap", **fl.FIGURE_FILLS)),
+    ],
+)
+def test_bids_path_builder(patterns, fills):
+    from bids.layout.writing import build_path
+
+    filenames = [
+        "sub-001/ses-01/func/sub-001_ses-01_task-rest_echo-1_bold.nii.gz",
+        "sub-1/func/sub-1_task-bht_run-2_part-mag_bold.nii.gz",
+        "sub-1_bold.nii",
+    ]
+    for filename in filenames:
+        entities = {**fl.parse_entities(filename), **fills}
+        expected = build_path(entities, patterns)
+        assert fl.get_path_builder(tuple(patterns)).build(entities) == expected
+        assert fl.get_bids_savename(filename, patterns, **fills) == str(expected)
+
+    # The parsed entities are memoized but can be safely modified
+    fl.parse_entities(filenames[0])["subject"] = "002"
+    assert fl.parse_entities(filenames[0])["subject"] == "001"
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"strategy": ("motion", "high_pass", "wm_csf"), "motion": "full"},
+        {
+            "strategy": ("motion", "high_pass", "wm_csf", "scrub"),
+            "motion": "basic",
+            "scrub": 5,
+            "fd_threshold": 0.2,
+        },
+        {"strategy": ("high_pass", "compcor"), "n_compcor": 5},
+    ],
+)
+def test_load_confounds_parallel(tmp_path, params):
+    import shutil
+    import nilearn.interfaces.fmriprep as fmriprep
+    from nilearn.interfaces.fmriprep import load_confounds
+
+    data_dir = op.join(op.dirname(fmriprep.__file__), "data")
+    func_dir = tmp_path / "sub-01" / "func"
+    func_dir.mkdir(parents=True)
+    for extension in ("tsv", "json"):
+        shutil.copy(
+            op.join(data_dir, f"test_desc-confounds_regressors.{extension}"),
+            func_dir / f"sub-01_task-rest_desc-confounds_timeseries.{extension}",
+        )
+    func_file = str(
+        func_dir / "sub-01_task-rest_space-MNI152NLin2009cAsym_desc-preproc_bold.nii.gz"
+    )
+
+    expected_confounds, expected_sample_mask = load_confounds(
+        func_file, demean=False, **params
+    )
+
+    # Parsed from the file, then from the cache
+    for _ in range(2):
+        confounds, sample_mask = fl.load_confounds_parallel(
+            [func_file, func_file], cache_dir=str(tmp_path), demean=False, **params
+        )
+        assert len(confounds) == len(sample_mask) == 2
+        pd.testing.assert_frame_equal(confounds[1], expected_confounds)
+        if expected_sample_mask is None:
+            assert sample_mask[1] is None
+        else:
+            np.testing.assert_array_equal(sample_mask[1], expected_sample_mask)
+
+    assert len(os.listdir(tmp_path / fl.CONFOUNDS_CACHE_DIRNAME)) == 1
+
+    with pytest.raises(ValueError, match="motions"):
+        fl.load_confounds_parallel([func_file], strategy=("motions",))
+
+
+def test_stale_binary_sidecar(tmp_path):
+    func_filename = ["sub-1/func/sub-1_bold.nii"]
+    patterns = ["sub-{subject}_meas-{meas}_{suffix}{extension}"]
+    tsv_path = tmp_path / "sub-1_meas-correlation_connectivity.tsv"
+    npy_path = tmp_path / "sub-1_meas-correlation_connectivity.npy"
+
+    old, new = np.zeros((2, 2)), np.ones((2, 2))
+    fl.save_output(
+        [old],
+        func_filename,
+        str(tmp_path),
+        "both",
+        patterns=patterns,
+        meas="correlation",
+        **fl.FC_FILLS,
+    )
+
+    # Writing the TSV file alone removes the sidecar of the previous run
+    fl.save_output(
+        [new],
+        func_filename,
+        str(tmp_path),
+        "tsv",
+        patterns=patterns,
+        meas="correlation",
+        **fl.FC_FILLS,
+    )
+    assert not npy_path.exists()
+    assert np.allclose(fl.load_array(str(tsv_path)), new)
+
+    # A sidecar older than the TSV file is ignored
+    np.save(npy_path, old)
+    os.utime(npy_path, ns=(0, 0))
+    assert np.allclose(fl.load_array(str(tsv_path)), new)
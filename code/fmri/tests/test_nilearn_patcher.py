@@ -0,0 +1,52 @@
+import numpy as np
+import nibabel as nb
+import pytest
+from nilearn.maskers import NiftiMapsMasker
+
+from fmri.nilearn_patcher import MapsProjector
+
+
+def test_maps_projector(tmp_path):
+    rng = np.random.default_rng(0)
+    affine = np.diag([2, 2, 2, 1])
+    maps = rng.random((6, 6, 6, 4)).astype("float32")
+    maps[maps < 0.5] = 0
+    maps_file = str(tmp_path / "maps.nii.gz")
+    nb.Nifti1Image(maps, affine).to_filename(maps_file)
+    bold = rng.standard_normal((6, 6, 6, 25)).astype("float32")
+    bold_file = str(tmp_path / "sub-1_task-rest_bold.nii.gz")
+    nb.Nifti1Image(bold, affine).to_filename(bold_file)
+
+    expected = NiftiMapsMasker(maps_img=maps_file).fit_transform(bold_file)
+
+    # Chunks that do not divide the number of volumes, projector stored on disk
+    projector = MapsProjector(maps_file, chunk_size=7, cache_dir=str(tmp_path))
+    (signals,) = projector.fit_transform([bold_file])
+    np.testing.assert_allclose(signals, expected, rtol=1e-4, atol=1e-5)
+    assert len(list(tmp_path.glob("projector_*.npz"))) == 1
+
+    other_grid = nb.Nifti1Image(bold[:5], affine)
+    with pytest.raises(ValueError, match="same grid"):
+        projector.transform_single_imgs(other_grid)
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_maps_projector_scaled_image(tmp_path, in_memory):
+    rng = np.random.default_rng(0)
+    affine = np.diag([2, 2, 2, 1])
+    maps = rng.random((5, 6, 7, 3)).astype("float32")
+    maps_file = str(tmp_path / "maps.nii.gz")
+    nb.Nifti1Image(maps, affine).to_filename(maps_file)
+
+    # Integers with a scale factor, as written by some pipelines
+    bold = nb.Nifti1Image(rng.integers(-1000, 1000, (5, 6, 7, 20), "int16"), affine)
+    bold.header.set_slope_inter(0.5, 10)
+    bold_file = str(tmp_path / "sub-1_task-rest_bold.nii.gz")
+    bold.to_filename(bold_file)
+    bold = nb.load(bold_file)
+    if in_memory:
+        bold = nb.Nifti1Image(bold.get_fdata(), affine)
+
+    expected = NiftiMapsMasker(maps_img=maps_file).fit_transform(bold)
+    signals = MapsProjector(maps_file, chunk_size=6).fit().transform_single_imgs(bold)
+    np.testing.assert_allclose(signals, expected, rtol=1e-4, atol=1e-5)
@@ -0,0 +1,49 @@
+import importlib
+import json
+import os.path as op
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def reports(monkeypatch):
+    # reports imports its sibling modules by their bare name, as the scripts do
+    monkeypatch.syspath_prepend(op.dirname(op.dirname(op.abspath(__file__))))
+    matplotlib.use("Agg")
+    return importlib.import_module("reports")
+
+
+@pytest.mark.parametrize("as_frame", [False, True])
+def test_queue_and_render_session_reports(reports, tmp_path, as_frame):
+    output = str(tmp_path)
+    filename = "sub-001/ses-001/func/sub-001_ses-001_task-rest_bold.nii.gz"
+    rng = np.random.default_rng(0)
+    timeseries_path = op.join(output, "timeseries.tsv")
+    np.savetxt(timeseries_path, rng.standard_normal((50, 8)), delimiter="\t")
+    confounds = rng.standard_normal((50, 3))
+    if as_frame:
+        confounds = pd.DataFrame(confounds, columns=["trans_x", "trans_y", "rot_z"])
+
+    queue_path = reports.queue_reports(
+        output,
+        [
+            {
+                "kind": "session",
+                "filename": filename,
+                "timeseries_path": timeseries_path,
+                "confounds": confounds,
+                "fast": True,
+            }
+        ],
+    )
+    with open(queue_path) as f:
+        (spec,) = [json.loads(line) for line in f]
+    assert spec["confounds_path"].endswith(".tsv" if as_frame else ".npy")
+
+    rendered = reports.render_queued_report(spec, output)
+    design_matrix = reports.get_figure_path(filename, output, "designmatrix")
+    assert design_matrix in rendered
+    assert op.exists(design_matrix)
@@ -28,6 +28,7 @@ import numpy as np
 import pandas as pd
 import h5py
 
+from physiotsv import write_physio_tsvgz
 from splitruns import DATA_PATH, BIDS_PATH, parse_session, main as extract
 
 RECALIBRATED_SESSION = 23
@@ -138,12 +139,11 @@ def extract_signal(recording, src_file, out_path, channels, first_trigger_t, ses
     sidecar["Columns"] = list(recording_data.keys())
 
     # We can store data now
-    pd.DataFrame(recording_data).to_csv(
+    write_physio_tsvgz(
+        pd.DataFrame(recording_data),
         recording_filepath,
-        compression="gzip",
-        header=False,
-        sep="\t",
         na_rep="n/a",
+        index=True,
     )
     print(f"Recording updated: {recording_filepath}")
 
@@ -233,12 +233,11 @@ def convert(
         trigger_filepath.parent / trigger_filepath.name.replace(".tsv.gz", ".json")
     ).write_text(dumps(trigger_sidecar, indent=2))
 
-    pd.DataFrame(trigger_data).to_csv(
+    write_physio_tsvgz(
+        pd.DataFrame(trigger_data),
         trigger_filepath,
-        compression="gzip",
-        header=False,
-        sep="\t",
         na_rep="n/a",
+        index=True,
     )
 
     out_files = []
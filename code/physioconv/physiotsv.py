@@ -0,0 +1 @@
+../eyetracking/physiotsv.py
\ No newline at end of file